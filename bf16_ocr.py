@@ -0,0 +1,115 @@
+import os
+import json
+
+import torch
+from PIL import Image, ImageDraw, ImageFont
+
+from manga_ocr_engine import MangaOcrEngine
+from ocr_metrics import load_corpus
+
+# manga-ocr在autocast下用bfloat16推理，只在支持AVX512-BF16或者AMX的CPU上启用
+# 启用之前用一组样本比较bf16和fp32的识别结果，不一致时继续用fp32
+# 检查结果保存在data/manga-ocr-bf16.json，torch版本或者CPU变化时重新检查
+
+root_path = os.path.dirname(os.path.abspath(__file__))
+sample_path = os.path.join(root_path, 'data', 'ocr-samples')
+# 和quant_report相同格式的测试集，不存在时用生成的图片
+check_file = os.path.join(root_path, 'data', 'manga-ocr-bf16.json')
+min_agreement = 1.0
+# 样本中bf16和fp32结果一致的比例，达到这个值才启用
+
+
+def get_cpu_features():
+    # 返回CPU支持的bf16相关指令集，torch和/proc/cpuinfo检测到的都算
+    features = set()
+    cpu = getattr(torch._C, '_cpu', None)
+    for name, feature in [('_is_avx512_bf16_supported', 'avx512_bf16'), ('_is_amx_tile_supported', 'amx_tile')]:
+        func = getattr(cpu, name, None)
+        if func is not None and func():
+            features.add(feature)
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    features.update(set(line.split(':', 1)[1].split()) & {'avx512_bf16', 'amx_bf16'})
+                    break
+    return sorted(features)
+
+
+def cpu_supports_bf16():
+    return len(get_cpu_features()) > 0
+
+
+def get_check_key():
+    # 换了CPU时platform.processor()在linux上通常是空字符串，用检测到的指令集区分
+    return f'{torch.__version__}|{"+".join(get_cpu_features())}'
+
+
+def load_check_result():
+    if not os.path.exists(check_file):
+        return None
+    try:
+        with open(check_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get(get_check_key())
+    except (OSError, ValueError) as e:
+        print('load bf16 check error', e)
+        return None
+
+
+def save_check_result(passed):
+    tmp_file = f'{check_file}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({get_check_key(): passed}, f)
+        os.replace(tmp_file, check_file)
+    except OSError as e:
+        print('save bf16 check error', e)
+
+
+def get_samples():
+    if os.path.isdir(sample_path):
+        corpus = load_corpus(sample_path)
+        if corpus:
+            return [img for name, img, label in corpus]
+    # 没有测试集时用几张生成的文字图片，只比较两种精度的结果是否一致，不要求识别正确
+    font = ImageFont.load_default()
+    samples = []
+    for text in ['12345', 'ABCDE', 'OCR bf16', '2024/01/01']:
+        img = Image.new('RGB', (160, 48), 'white')
+        ImageDraw.Draw(img).text((8, 16), text, fill='black', font=font)
+        samples.append(img)
+    return samples
+
+
+class Bf16MangaOcr(MangaOcrEngine):
+    def __init__(self, pretrained_model_name_or_path):
+        super().__init__(pretrained_model_name_or_path=pretrained_model_name_or_path, force_cpu=True)
+        self.use_bf16 = False
+        if not cpu_supports_bf16():
+            print('cpu does not support bf16, use fp32')
+            return
+
+        passed = load_check_result()
+        if passed is None:
+            passed = self.self_check(get_samples())
+            save_check_result(passed)
+        self.use_bf16 = passed
+        print('manga-ocr bf16' if passed else 'manga-ocr bf16 check failed, use fp32')
+
+    def self_check(self, samples):
+        agreed = 0
+        for img in samples:
+            self.use_bf16 = False
+            expected = self(img)
+            self.use_bf16 = True
+            result = self(img)
+            if result == expected:
+                agreed += 1
+            else:
+                print('bf16 mismatch', expected, result)
+        self.use_bf16 = False
+        return len(samples) > 0 and agreed / len(samples) >= min_agreement
+
+    def _generate(self, pixel_values, **kwargs):
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.use_bf16):
+            return super()._generate(pixel_values, **kwargs)
@@ -2,15 +2,16 @@
 # SPDX-License-Identifier: LicenseRef-Qt-Commercial OR BSD-3-Clause
 
 import time
+from functools import partial
 from config_parser import *
 
 from PySide6.QtWebEngineCore import QWebEnginePage
 from PySide6.QtWidgets import (QMainWindow, QFileDialog,
                                QInputDialog, QLineEdit, QMenu, QMessageBox,
                                QProgressBar, QToolBar, QVBoxLayout, QWidget, QApplication, QSystemTrayIcon)
-from PySide6.QtGui import QAction, QActionGroup, QGuiApplication, QIcon, QKeySequence, QClipboard, QScreen, \
+from PySide6.QtGui import QAction, QActionGroup, QGuiApplication, QIcon, QKeySequence, QClipboard, \
     QDesktopServices
-from PySide6.QtCore import QUrl, Qt, QThread, Slot, Signal, QRect
+from PySide6.QtCore import QUrl, Qt, QThread, Slot, Signal, QRect, QTimer
 
 from tabwidget import TabWidget
 
@@ -21,13 +22,26 @@ from ctypes.wintypes import DWORD, HHOOK, HINSTANCE, MSG, WPARAM, LPARAM, HMODUL
 import win32con
 import win32api
 import win32clipboard
+import win32gui
 
 import screen_show
-from PIL import ImageGrab, ImageQt
+from PIL import ImageQt
 import os
-import pytesseract
+import psutil
+from tesseract_engine import create_tesseract
+from script_detect import ScriptDetector
+from ocr_preprocess import preprocess
+from text_layout import LayoutDetector
 import re
-from manga_ocr import MangaOcr
+from ocr_executor import OcrExecutor
+from ocr_engine import OcrEngineRegistry, OcrRouter, ExecutorOcrEngine, TesseractOcrEngine, RaceOcrEngine
+from ocr_cache import OcrCache
+from click_detect import get_click_region, find_text_box
+from hover_ocr import HoverTracker
+from screen_capture import create_capture
+from screen_topology import ScreenTopology
+from frame_ring import FrameCapturer
+from thread_budget import get_ocr_threads, set_omp_threads, CpuMeter
 from tabdialog import TabDialog
 from helpDialog import HelpDialog
 
@@ -96,6 +110,12 @@ class BrowserWindow(QMainWindow):
         self.setWindowFlag(Qt.WindowStaysOnTopHint, True)
 
         self.ocr_engine = 'manga-ocr'
+        # 托盘菜单中选择的引擎，auto表示由OcrRouter选择
+        self.click_mode = False
+        # 单击取词，触发后直接识别鼠标位置的单词，不显示截图窗口
+        self.hover_mode = False
+        # 悬停取词，按住修饰键时识别鼠标下的单词
+        self.hover_keys = {}
 
         self.lang_con = 'eng+jpn+chi_sim'
         # pytesseract设置：'eng', 'chi_sim': '中文简体', 'chi_tra': '中文繁体', 'jpn': '日文'
@@ -120,6 +140,7 @@ class BrowserWindow(QMainWindow):
         self.timer = None
 
         self.grab_window = None
+        self.grab_hwnd = None
 
         self.copy_flag = False
         self.trigger_flag = False
@@ -136,7 +157,9 @@ class BrowserWindow(QMainWindow):
         self.view_height = 600
         self.resize(self.view_width, self.view_height)
 
-        self.mocr = None
+        self.ocr_executor = None
+        self.ocr_cache_keys = {}
+        self.ocr_request_id = 0
         self.word = ''
 
         self.config = get_config()
@@ -170,10 +193,25 @@ class BrowserWindow(QMainWindow):
         self.clipboard = QApplication.clipboard()
         self.clipboard.changed.connect(self.search_trigger)
 
-        self.create_screens()
+        self.screen_topology = ScreenTopology(self)
+
+        self.overlay_pool = screen_show.OverlayPool(self)
+
+        self.capture = create_capture(self.config['OCR']['CAPTURE_BACKEND'].lower())
+        print('capture backend', self.capture.name)
+
+        self.create_ocr_engines()
 
         self.create_tray()
 
+        self.create_ocr_cache()
+
+        self.create_hover()
+
+        self.create_ocr_idle()
+
+        self.create_frame_capturer()
+
         self._progress_bar = None
         self._history_back_action = None
         self._history_forward_action = None
@@ -252,10 +290,11 @@ class BrowserWindow(QMainWindow):
         self.help_dialog = HelpDialog(self)
         self.config_view = TabDialog(self)
 
-        self.load_manga_ocr()
-
         self.set_hook()
 
+        # 窗口创建完成后再在后台加载模型，不阻塞启动
+        QTimer.singleShot(0, self.load_manga_ocr)
+
     @Slot(str)
     def _show_status_message(self, m):
         self.statusBar().showMessage(m)
@@ -640,8 +679,184 @@ class BrowserWindow(QMainWindow):
 
     # -----------------------------------------------------------------------------------------------------------------
 
+    def create_ocr_engines(self):
+        try:
+            workers = int(self.config['OCR']['WORKERS'])
+        except ValueError:
+            workers = 1
+        try:
+            tesseract_min_conf = float(self.config['OCR']['TESSERACT_MIN_CONF'])
+        except ValueError:
+            tesseract_min_conf = 0
+        try:
+            race_threshold = float(self.config['OCR']['RACE_THRESHOLD'])
+        except ValueError:
+            race_threshold = 0.8
+        try:
+            reserve_cores = int(self.config['OCR']['RESERVE_CORES'])
+        except ValueError:
+            reserve_cores = 1
+        try:
+            tesseract_threads = max(1, int(self.config['OCR']['TESSERACT_THREADS']))
+        except ValueError:
+            tesseract_threads = 1
+        try:
+            # manga-ocr的模型是一条链，同时能运行的算子很少，一般1个inter-op线程就够
+            interop_threads = max(1, int(self.config['OCR']['INTEROP_THREADS']))
+        except ValueError:
+            interop_threads = 1
+
+        # 给QtWebEngine保留reserve_cores个核，剩下的平分给OCR子进程
+        ocr_threads = get_ocr_threads(self.config['OCR']['THREADS'], reserve_cores, workers)
+        print('ocr threads', ocr_threads, 'x', workers, 'interop', interop_threads)
+        # tesseract在本进程中加载，子进程启动时会按ocr_threads重新设置
+        set_omp_threads(tesseract_threads)
+        self.cpu_meter = CpuMeter()
+        self.grab_cpu_time = None
+        self.ocr_status = ''
+        self.ocr_rss = 0
+
+        self.ocr_executor = OcrExecutor('manga-ocr', workers, self.max_word_length, ocr_threads, interop_threads,
+                                        self)
+        self.tesseract = create_tesseract(self.config['OCR']['TESSERACT_BACKEND'], data_path)
+        self.script_detector = ScriptDetector()
+        self.layout_detector = LayoutDetector()
+        self.preprocess_steps = self.config['OCR']['PREPROCESS']
+
+        # 托盘的OCR菜单按注册的顺序显示
+        self.ocr_registry = OcrEngineRegistry()
+        self.ocr_registry.register(ExecutorOcrEngine('manga-ocr', self.ocr_executor, 500, self))
+        self.ocr_registry.register(TesseractOcrEngine(self.tesseract, self.lang_con, tesseract_min_conf, self))
+        self.ocr_registry.register(ExecutorOcrEngine('manga-ocr-onnx', self.ocr_executor, 250, self))
+        self.ocr_registry.register(ExecutorOcrEngine('manga-ocr-int8', self.ocr_executor, 300, self))
+        # 不支持bf16的CPU上和manga-ocr相同
+        self.ocr_registry.register(ExecutorOcrEngine('manga-ocr-bf16', self.ocr_executor, 350, self))
+        # race同时使用当前加载的manga-ocr系列引擎和tesseract
+        self.ocr_registry.register(RaceOcrEngine(list(self.ocr_registry), race_threshold, self))
+        for engine in self.ocr_registry:
+            engine.result_ready.connect(partial(self.handle_ocr_result, engine))
+            engine.error_occurred.connect(partial(self.handle_ocr_error, engine))
+            engine.state_changed.connect(self.handle_ocr_state_changed)
+        self.ocr_router = OcrRouter(self.ocr_registry)
+
     def load_manga_ocr(self):
-        self.mocr = MangaOcr(pretrained_model_name_or_path='data/manga-ocr-base/')
+        self.ocr_executor.start()
+
+    @Slot(str)
+    def handle_ocr_state_changed(self, state):
+        for engine in self.ocr_registry:
+            engine_state = engine.state()
+            action = self.ocr_engine_actions[engine.name]
+            if engine_state == 'unloaded' or engine.name == 'pytesseract':
+                action.setText(engine.name)
+            else:
+                action.setText(f'{engine.name} ({engine_state})')
+        self.update_tray_tooltip()
+        print(self.ocr_executor.engine, self.ocr_executor.state)
+
+    def update_tray_tooltip(self):
+        tooltip = f'Django Mdict Tool\n{self.ocr_executor.engine}: {self.ocr_executor.state}'
+        if self.ocr_rss > 0:
+            tooltip += f' ({self.ocr_rss / 1024 / 1024:.0f}MB)'
+        if self.ocr_status != '':
+            tooltip += f'\n{self.ocr_status}'
+        self.tray.setToolTip(tooltip)
+
+    def handle_ocr_result(self, engine, request_id, text, conf):
+        # 所有引擎的结果都会到这里，race模式下子引擎的结果由RaceOcrEngine处理，这里忽略
+        if not self.ocr_router.finish(request_id, engine.name, True):
+            return
+        self.ocr_engine_actions[engine.name].setToolTip(self.ocr_router.summary(engine.name))
+        source = engine.result_source()
+        if source != engine.name:
+            self.ocr_engine_actions[engine.name].setText(f'{engine.name} ({source})')
+        cpu_time = ''
+        if self.grab_cpu_time is not None:
+            # 从预处理开始到识别完成，本进程和OCR子进程一共用的CPU时间
+            cpu_time = max(0.0, self.cpu_meter.snapshot(self.ocr_executor.worker_pids) - self.grab_cpu_time)
+            print(f'ocr cpu time {cpu_time * 1000:.0f}ms')
+            cpu_time = f', cpu {cpu_time * 1000:.0f}ms'
+            self.grab_cpu_time = None
+        self.ocr_status = f'ocr: {source} ({conf:.0%}{cpu_time})'
+        self.update_tray_tooltip()
+        key = self.ocr_cache_keys.pop(request_id, None)
+        hover_key = self.hover_keys.pop(request_id, None)
+        if hover_key is not None:
+            self.hover_tracker.put(hover_key, text)
+        self.search_ocr_text(text, key)
+
+    def handle_ocr_error(self, engine, request_id, error):
+        if not self.ocr_router.finish(request_id, engine.name, False):
+            return
+        self.ocr_engine_actions[engine.name].setToolTip(self.ocr_router.summary(engine.name))
+        self.ocr_cache_keys.pop(request_id, None)
+        print('ocr error', request_id, error)
+
+    def create_hover(self):
+        hover_keys = {
+            'shift': win32con.VK_SHIFT,
+            'ctrl': win32con.VK_CONTROL,
+            'alt': win32con.VK_MENU,
+        }
+        self.hover_vk = hover_keys.get(self.config['OCR']['HOVER_KEY'].lower(), win32con.VK_SHIFT)
+        try:
+            self.hover_interval = max(50, int(self.config['OCR']['HOVER_INTERVAL']))
+        except ValueError:
+            self.hover_interval = 150
+        self.hover_tracker = HoverTracker()
+        self.hover_timer = QTimer(self)
+        self.hover_timer.timeout.connect(self.hover_tick)
+
+    def create_ocr_idle(self):
+        # 长时间不用或者系统内存不足时释放manga-ocr模型，下一次截屏查词时在后台重新加载
+        try:
+            self.ocr_idle_timeout = int(self.config['OCR']['IDLE_UNLOAD'])
+        except ValueError:
+            self.ocr_idle_timeout = 600
+        try:
+            self.ocr_memory_pressure = float(self.config['OCR']['MEMORY_PRESSURE'])
+        except ValueError:
+            self.ocr_memory_pressure = 90
+        self.ocr_idle_timer = QTimer(self)
+        self.ocr_idle_timer.timeout.connect(self.check_ocr_idle)
+        self.ocr_idle_timer.start(30000)
+
+    def check_ocr_idle(self):
+        executor = self.ocr_executor
+        self.ocr_rss = executor.memory_rss()
+        self.update_tray_tooltip()
+        if executor.state != 'ready':
+            return
+
+        idle = executor.idle_time()
+        memory_percent = psutil.virtual_memory().percent
+        if 0 < self.ocr_idle_timeout < idle:
+            print(f'ocr model idle for {idle:.0f}s, unload')
+        elif 0 < self.ocr_memory_pressure <= memory_percent and idle > 60:
+            # 正在连续查词时不释放
+            print(f'memory usage {memory_percent}%, unload ocr model')
+        else:
+            return
+        executor.shutdown()
+        self.ocr_rss = 0
+        self.update_tray_tooltip()
+
+    def reload_ocr_model(self):
+        # 模型释放后第一次截屏查词，这一次先用tesseract，manga-ocr在后台加载
+        if self.ocr_executor.state != 'unloaded' or self.ocr_engine == 'pytesseract':
+            return
+        print('reload ocr model')
+        self.ocr_executor.start()
+
+    def create_ocr_cache(self):
+        try:
+            cache_size = int(self.config['OCR']['CACHE_SIZE'])
+        except ValueError:
+            cache_size = 256
+        cache_file = self.config['OCR']['CACHE_FILE']
+        if cache_file != '' and not os.path.isabs(cache_file):
+            cache_file = os.path.join(root_path, cache_file)
+        self.ocr_cache = OcrCache(cache_size, cache_file)
 
     def get_last_tab(self):
         self.search_view = self._tab_widget.current_web_view()
@@ -703,20 +918,36 @@ class BrowserWindow(QMainWindow):
         self.menu_ocr.setToolTip('OCR engine selection')
         self.icon_ocr = QIcon('data/imgs/baseline_zoom_out_black_48dp.png')
         self.menu_ocr.setIcon(self.icon_ocr)
-        self.action_engine1 = QAction('manga-ocr')
-        self.action_engine1.triggered.connect(self.set_ocr_engine)
-        self.action_engine2 = QAction('pytesseract')
-        self.action_engine2.triggered.connect(self.set_ocr_engine)
-        self.action_engine1.setCheckable(True)
-        self.action_engine1.setChecked(True)
-        self.action_engine2.setCheckable(True)
-        self.menu_ocr.addAction(self.action_engine1)
-        self.menu_ocr.addAction(self.action_engine2)
-
         self.action_group_engines = QActionGroup(self.menu_ocr)
         self.action_group_engines.setExclusive(True)
-        self.action_group_engines.addAction(self.action_engine1)
-        self.action_group_engines.addAction(self.action_engine2)
+        self.ocr_engine_actions = {}
+        for name in self.ocr_registry.names() + ['auto']:
+            if name == 'auto':
+                self.menu_ocr.addSeparator()
+            action = QAction(name)
+            action.setData(name)
+            action.setCheckable(True)
+            action.setChecked(name == self.ocr_engine)
+            action.triggered.connect(self.set_ocr_engine)
+            self.menu_ocr.addAction(action)
+            self.action_group_engines.addAction(action)
+            self.ocr_engine_actions[name] = action
+        self.ocr_engine_actions['auto'].setToolTip('fastest available engine for the detected script')
+
+        self.menu_ocr.addSeparator()
+        self.action_click_mode = QAction('click mode')
+        self.action_click_mode.setToolTip('OCR the word or bubble under the cursor without dragging')
+        self.action_click_mode.setCheckable(True)
+        self.action_click_mode.setChecked(self.click_mode)
+        self.action_click_mode.triggered.connect(self.click_mode_toggle)
+        self.menu_ocr.addAction(self.action_click_mode)
+
+        self.action_hover_mode = QAction('hover mode')
+        self.action_hover_mode.setToolTip(f'OCR the word under the cursor while holding {self.config["OCR"]["HOVER_KEY"]}')
+        self.action_hover_mode.setCheckable(True)
+        self.action_hover_mode.setChecked(self.hover_mode)
+        self.action_hover_mode.triggered.connect(self.hover_mode_toggle)
+        self.menu_ocr.addAction(self.action_hover_mode)
 
         self.menu.addMenu(self.menu_ocr)
 
@@ -841,27 +1072,16 @@ class BrowserWindow(QMainWindow):
             self.setWindowFlag(Qt.FramelessWindowHint, False)
 
     def set_ocr_engine(self):
-        if self.action_engine1.isChecked():
-            self.ocr_engine = 'manga-ocr'
-        elif self.action_engine2.isChecked():
-            self.ocr_engine = 'pytesseract'
-        else:
+        action = self.action_group_engines.checkedAction()
+        if action is None:
             print('ocr engine error')
             self.ocr_engine = 'manga-ocr'
+        else:
+            self.ocr_engine = action.data()
 
-    def create_screens(self):
-        self.available_screens = []
-
-        for screen in QApplication.screens():
-            # sc = QScreen.availableGeometry(screen)
-            scn = QScreen.geometry(screen)
-            sx = scn.x()
-            sy = scn.y()
-            sw = scn.width()
-            sh = scn.height()
-            sc = QScreen.devicePixelRatio(screen)
-
-            self.available_screens.append((sx, sy, sw, sh, sc))
+        engine = self.ocr_registry.get(self.ocr_engine)
+        if engine is not None:
+            engine.load()
 
     def show_search_view(self):
         if self.isMinimized():
@@ -890,28 +1110,20 @@ class BrowserWindow(QMainWindow):
         else:
             return True
 
-    def grab_image(self):
+    def get_cursor_screen(self):
         mouse_x, mouse_y = self.get_mouse_pos()
-        screen_index = self.check_screen_id(mouse_x)
-        self.create_screens()
-        sx, sy, sw, sh, sc = self.available_screens[screen_index]
+        return self.screen_topology.screen_at(mouse_x, mouse_y)
 
-        img = ImageGrab.grab(all_screens=True)
-        # img.save('test.png')
+    def grab_rect(self, sx, sy, left, top, width, height):
+        # 只截取屏幕(sx, sy)中的一块，left, top是在这个屏幕截图中的像素坐标
         # 主屏幕的左上角是屏幕的坐标原点，x轴向右，y轴向下
-        # 截图的时候需要将屏幕的原点移动到截图的原点
-        f_sx = 0
-        f_sy = 0
-
-        for tsx, tsy, tsw, tsh, tsc in self.available_screens:
-            if tsx < f_sx:
-                f_sx = tsx
-            if tsy < f_sy:
-                f_sy = tsy
-        crop_left, crop_top, crop_right, crop_bottom = sx + abs(f_sx), sy + abs(f_sy), sx + abs(
-            f_sx) + sw * sc, sy + abs(f_sy) + sh * sc
-        img = img.crop((crop_left, crop_top, crop_right, crop_bottom))
+        return self.capture.grab(int(sx + left), int(sy + top), int(width), int(height))
 
+    def grab_image(self):
+        # 截取鼠标所在的整个屏幕
+        sx, sy, sw, sh, sc = self.get_cursor_screen()
+        img = self.grab_rect(sx, sy, 0, 0, sw * sc, sh * sc)
+        # img.save('test.png')
         return img, sx, sy, sw, sh, sc
 
     def append_word(self):
@@ -921,11 +1133,137 @@ class BrowserWindow(QMainWindow):
         if len(self.word_list) > 10:
             self.word_list = self.word_list[-11:]
 
+    def click_mode_toggle(self):
+        self.click_mode = self.action_click_mode.isChecked()
+
+    def hover_mode_toggle(self):
+        self.hover_mode = self.action_hover_mode.isChecked()
+        self.hover_tracker.reset()
+        if self.hover_mode:
+            self.hover_timer.start(self.hover_interval)
+        else:
+            self.hover_timer.stop()
+
+    def hover_tick(self):
+        if self.pause or win32api.GetAsyncKeyState(self.hover_vk) & 0x8000 == 0:
+            self.hover_tracker.reset()
+            return
+        mouse_x, mouse_y = self.get_mouse_pos()
+        if not self.hover_tracker.should_capture((mouse_x, mouse_y)):
+            return
+
+        try:
+            sx, sy, sw, sh, sc = self.get_cursor_screen()
+            screen = (sx, sy)
+            x = int((mouse_x - sx) * sc)
+            y = int((mouse_y - sy) * sc)
+            left, top, right, bottom = self.hover_tracker.get_region(int(sw * sc), int(sh * sc), x, y, sc)
+            # 只截取鼠标周围的区域
+            region = self.grab_rect(sx, sy, left, top, right - left, bottom - top)
+        except Exception as e:
+            print('hover grab error', e)
+            return
+        changed = self.hover_tracker.update(region, screen, left, top)
+        if not changed and self.hover_tracker.in_last_box(screen, x, y):
+            # 画面没变，鼠标还在上次的单词上
+            return
+
+        box = find_text_box(region, x - left, y - top)
+        if box is None:
+            return
+        word_box = (left + box[0], top + box[1], left + box[2], top + box[3])
+        key = self.hover_tracker.word_key(screen, *word_box)
+        if not self.hover_tracker.set_word(screen, word_box, key):
+            return
+        text = self.hover_tracker.get(key)
+        if text is not None:
+            # 单词覆盖的小块都没有变化，直接使用上次识别的文字
+            self.search_ocr_text(text)
+            return
+
+        self.grab_hwnd = win32gui.GetForegroundWindow()
+        request_id = self.grab_search_word(region.crop(box))
+        if request_id is not None:
+            self.hover_keys = {request_id: key}
+
+    def grab_click_region(self, sx, sy, sw, sh, sc, x, y):
+        # x, y是点击位置在屏幕截图中的像素坐标
+        x = int(x)
+        y = int(y)
+        left, top, right, bottom = get_click_region(int(sw * sc), int(sh * sc), x, y, sc)
+        # 只截取点击位置周围的区域
+        region = self.grab_rect(sx, sy, left, top, right - left, bottom - top)
+        box = find_text_box(region, x - left, y - top)
+        return None if box is None else region.crop(box)
+
+    def grab_click_word(self):
+        try:
+            self.grab_hwnd = win32gui.GetForegroundWindow()
+            mouse_x, mouse_y = self.get_mouse_pos()
+            sx, sy, sw, sh, sc = self.get_cursor_screen()
+            cap = self.grab_click_region(sx, sy, sw, sh, sc, (mouse_x - sx) * sc, (mouse_y - sy) * sc)
+        except Exception as e:
+            print('grab error', e)
+            return
+        if cap is None:
+            print('no text under cursor')
+            return
+        self.grab_search_word(cap)
+
+    def grab_fresh_word(self, sx, sy, sw, sh, sc, x1, y1, x2, y2, x, y):
+        # 截图窗口显示的是预览帧，选中范围后重新截取这一块
+        try:
+            if abs(x1 - x2) < 5 or abs(y1 - y2) < 5:
+                cap = self.grab_click_region(sx, sy, sw, sh, sc, x, y)
+            else:
+                cap = self.grab_rect(sx, sy, x1, y1, x2 - x1, y2 - y1)
+        except Exception as e:
+            print('grab error', e)
+            return
+        if cap is None:
+            print('no text under cursor')
+            return
+        self.grab_search_word(cap)
+
+    def create_frame_capturer(self):
+        # 后台以较低的帧率截取鼠标所在的屏幕，截屏查词时直接显示最新的一帧
+        self.frame_capturer = None
+        try:
+            frames = int(self.config['OCR']['PREVIEW_FRAMES'])
+            fps = float(self.config['OCR']['PREVIEW_FPS'])
+        except ValueError:
+            print('preview frames config error')
+            return
+        if frames <= 0 or fps <= 0:
+            return
+        self.frame_capturer = FrameCapturer(self.config['OCR']['CAPTURE_BACKEND'].lower(), frames, fps)
+        self.frame_capturer.start()
+        self.frame_timer = QTimer(self)
+        self.frame_timer.timeout.connect(self.update_frame_screen)
+        self.frame_timer.start(round(1000 / fps))
+
+    def update_frame_screen(self):
+        # 暂停时不截图
+        self.frame_capturer.set_screen(None if self.pause else self.get_cursor_screen())
+
     def grab_word(self):
+        if self.click_mode:
+            self.grab_click_word()
+            return
         try:
-            img, sx, sy, sw, sh, sc = self.grab_image()
-            self.grab_window = screen_show.Ui_MainWindow(self, img, sx, sy, sw, sh, sc)
-            self.grab_window.show()
+            # 截图窗口显示之前，前台窗口就是要查词的窗口
+            self.grab_hwnd = win32gui.GetForegroundWindow()
+            img = None
+            if self.frame_capturer is not None:
+                screen = self.get_cursor_screen()
+                # 超过两帧的间隔说明后台截图出了问题，不使用
+                img = self.frame_capturer.latest(screen, self.frame_capturer.interval * 2)
+            if img is None:
+                img, sx, sy, sw, sh, sc = self.grab_image()
+                self.grab_window = self.overlay_pool.show_frame(img, sx, sy, sw, sh, sc)
+            else:
+                sx, sy, sw, sh, sc = screen
+                self.grab_window = self.overlay_pool.show_frame(img, sx, sy, sw, sh, sc, True)
         except Exception as e:
             self.grab_window = None
             print('grab error')
@@ -978,49 +1316,50 @@ class BrowserWindow(QMainWindow):
 
     def grab_search_word(self, img):
         self.reset_view()
-        if self.ocr_engine == 'manga-ocr' and self.mocr is not None:
-            text = self.mocr(img)
-            text = regp.sub('', text)
-            text = text.strip()
-            if 0 < len(text) < self.max_word_length:
-                self.trigger_search(text)
-        elif self.ocr_engine == 'pytesseract':
-            tess_cmd = '--psm 6 --oem 1 -c lstm_choice_iterations=0 -c page_separator=""'
-            if data_path != '':
-                tess_cmd = f'{tess_cmd} --tessdata-dir {data_path}'
-
-            data = pytesseract.image_to_data(img, lang=self.lang_con, config=tess_cmd)
-            data_list = [line.split('\t') for line in data.split('\n')]
-            text = ''
-            for di in range(1, len(data_list)):
-                # 去重
-                data = data_list[di]
-                if data[0] == '5' and len(data) == 12:
-                    if data[4] == '1':
-                        if di + 2 < len(data_list):
-                            edata = data_list[di + 2]
-                            if len(edata) == 12 and data[4] != edata[4]:
-                                text += data[-1][0]
-                            else:
-                                text += data[-1]
-                        else:
-                            text += data[-1]
-                    else:
-                        if data[4] != data_list[di - 2][4]:
-                            if data[5] == '1':
-                                text += data[-1][0]
-
-            # psm设置布局，小段文本6或7比较好，6可用于横向和竖向文字，7只能用于横向文字，文字方向转90度的用5。
-            # tesseract会在末尾加form feed分页符，unicode码000c。
-            # -c page_separator=""设置分页符为空
-            text = regp.sub('', text)
-            text = text.strip()
+        self.grab_cpu_time = self.cpu_meter.snapshot(self.ocr_executor.worker_pids)
+        self.reload_ocr_model()
+        # 预处理只做一次，缓存、语言判断和OCR引擎都使用处理后的图片
+        img = preprocess(img, self.preprocess_steps)
+        script = self.script_detector.detect_script(img, self.grab_hwnd)
+        engine = self.ocr_router.route(self.ocr_engine, script)
+        if engine is None:
+            print('no ocr engine available')
+            return
+        if engine.name != self.ocr_engine and self.ocr_engine != 'auto':
+            # 比如模型还没有加载完成时用pytesseract代替
+            print(f'{self.ocr_engine} is not available, use {engine.name}')
+
+        # psm设置布局，小段文本6或7比较好，6可用于横向和竖向文字，7只能用于横向文字，文字方向转90度的用5。
+        options = {
+            'lang': self.script_detector.select_lang(script, self.lang_con),
+            'layout': self.layout_detector.detect(img, self.grab_hwnd),
+            'script': self.script_detector.window_scripts.get(self.grab_hwnd),
+        }
+
+        key = self.ocr_cache.make_key(img, engine.name, engine.lang_key(options))
+        text = self.ocr_cache.get(key)
+        if text is not None:
+            # 命中缓存，跳过识别
+            print('ocr cache hit')
+            self.trigger_search(text)
+            return
 
-            if 0 < len(text) < self.max_word_length:
-                self.show_search_view()
-                self.trigger_search(text)
-        else:
-            raise Exception('ocr engine error')
+        # 结果由handle_ocr_result处理，manga-ocr不在GUI线程中识别
+        self.ocr_request_id += 1
+        request_id = self.ocr_request_id
+        self.ocr_cache_keys = {request_id: key}
+        self.ocr_router.begin(request_id, engine)
+        engine.recognize(request_id, img, options)
+        return request_id
+
+    def search_ocr_text(self, text, key=None):
+        text = regp.sub('', text)
+        text = text.strip()
+        self.script_detector.update(self.grab_hwnd, text)
+        if 0 < len(text) < self.max_word_length:
+            if key is not None:
+                self.ocr_cache.put(key, text)
+            self.trigger_search(text)
 
     def send_word(self):
         js_string = f'$("#mdict-modal-anki").modal("hide");$("#query").val(html_unescape("{self.word}"));$("#mdict-query").trigger("click");'
@@ -1028,6 +1367,13 @@ class BrowserWindow(QMainWindow):
 
     def quit(self):
         self.close_flag = True
+        for engine in self.ocr_registry:
+            engine.unload()
+        self.ocr_cache.save()
+        self.capture.close()
+        self.overlay_pool.close()
+        if self.frame_capturer is not None:
+            self.frame_capturer.stop()
         self.uninstallHookProc(self.keyboard_hook)
         self.uninstallHookProc(self.mouse_hook)
         print('Hook uninstalled')
@@ -1208,9 +1554,7 @@ class BrowserWindow(QMainWindow):
             self.sinOut.emit('')
 
     def adjust_view_pos(self, x, y, w, h):
-        index = self.check_screen_id(x)
-        self.create_screens()
-        sx, sy, sw, sh, sc = self.available_screens[index]
+        sx, sy, sw, sh, sc = self.screen_topology.screen_at(x, y)
 
         if x <= sx + 1:
             x = 5
@@ -1224,7 +1568,7 @@ class BrowserWindow(QMainWindow):
         return x, y
 
     def adjust_view_rect(self, x, y, w, h):
-        index = self.check_screen_id(x)
+        index = self.screen_topology.index_at(x, y)
         if self.screen_index != index:
             self.screen_toggle_flag = True
 
@@ -1236,7 +1580,7 @@ class BrowserWindow(QMainWindow):
                 self.screen_toggle_num = 0
             self.screen_toggle_num += 1
 
-        sx, sy, sw, sh, sc = self.available_screens[index]
+        sx, sy, sw, sh, sc = self.screen_topology.screens[index]
 
         if x <= sx + 1:
             x = 5
@@ -1249,12 +1593,6 @@ class BrowserWindow(QMainWindow):
 
         return QRect(x, y, w, h)
 
-    def check_screen_id(self, x):
-        for index, ava_screen in enumerate(self.available_screens):
-            if ava_screen[0] <= x <= ava_screen[0] + ava_screen[2]:
-                return index
-        return 0
-
     def get_mouse_pos(self):
         mouse_pos = self.cursor().pos()
         return mouse_pos.x(), mouse_pos.y()
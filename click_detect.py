@@ -0,0 +1,311 @@
+import numpy as np
+
+from script_detect import classify_image, get_runs
+from text_layout import get_bands
+
+# 单击取词：不用拖动选择矩形，在点击位置周围截取一块，用投影和连通区域找出点击的单词或者对话框
+# 拉丁字母只取点击的单词，确定是中日文字时取整个对话框（有边框的气泡）或者连在一起的文字块
+
+region_size = (480, 320)
+# 点击位置周围分析的范围，逻辑像素，宽和高
+cell = 2
+# 连通分析前把截图缩小cell倍，每个格子只要有文字像素就算文字
+ink_tolerance = 48
+# 和背景的灰度差大于这个值的像素算作文字
+background_radius = 24
+min_char = 8
+max_char = 160
+max_block = 16
+# 文字块最多是字号的max_block倍，超过时只取点击位置周围的部分
+padding = 4
+min_word_gap = 0.18
+word_gap_jump = 1.4
+# 同一行的空白中，单词间距至少是字号的min_word_gap倍，并且比最大的字母间距大word_gap_jump倍
+word_gap = 0.22
+# 两种空白分不开时，单词之间的空白至少是字号的word_gap倍
+
+
+def get_click_region(width, height, x, y, scale=1):
+    # 点击位置周围的截取范围(left, top, right, bottom)，限制在截图内
+    w = min(width, round(region_size[0] * scale))
+    h = min(height, round(region_size[1] * scale))
+    left = min(max(0, x - w // 2), width - w)
+    top = min(max(0, y - h // 2), height - h)
+    return left, top, left + w, top + h
+
+
+def get_ink(a, x, y):
+    # 点击位置附近的灰度中位数作为背景，文字比较稀疏，中位数基本是背景色
+    r = background_radius
+    patch = a[max(0, y - r):y + r, max(0, x - r):x + r]
+    background = np.median(patch)
+    return np.abs(a - background) > ink_tolerance
+
+
+def shrink(mask, factor=cell):
+    h, w = mask.shape
+    h2, w2 = -(-h // factor), -(-w // factor)
+    padded = np.zeros((h2 * factor, w2 * factor), dtype=bool)
+    padded[:h, :w] = mask
+    return padded.reshape(h2, factor, w2, factor).any(axis=(1, 3))
+
+
+def dilate(mask, rx, ry):
+    # 矩形结构元素的膨胀，用累加和计算每个窗口内是否有True
+    if rx <= 0 and ry <= 0:
+        return mask
+    h, w = mask.shape
+    s = np.pad(mask.astype(np.int32), ((ry + 1, ry), (rx + 1, rx))).cumsum(axis=0).cumsum(axis=1)
+    total = s[2 * ry + 1:, 2 * rx + 1:] - s[:h, 2 * rx + 1:] - s[2 * ry + 1:, :w] + s[:h, :w]
+    return total > 0
+
+
+def grow(seed, mask):
+    # 形态学重建：从seed开始在mask内向四邻域扩展，得到seed所在的连通区域
+    region = seed & mask
+    while True:
+        grown = region.copy()
+        grown[1:] |= region[:-1]
+        grown[:-1] |= region[1:]
+        grown[:, 1:] |= region[:, :-1]
+        grown[:, :-1] |= region[:, 1:]
+        grown &= mask
+        if np.array_equal(grown, region):
+            return region
+        region = grown
+
+
+def nearest(mask, x, y, max_distance):
+    ys, xs = np.nonzero(mask)
+    if len(ys) == 0:
+        return None
+    d = (ys - y) ** 2 + (xs - x) ** 2
+    i = np.argmin(d)
+    if d[i] > max_distance ** 2:
+        return None
+    return int(xs[i]), int(ys[i])
+
+
+def get_box(mask):
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    return cols[0], rows[0], cols[-1] + 1, rows[-1] + 1
+
+
+def get_band(profile, pos):
+    # 投影中包含pos的文字带[start, end)
+    starts, ends = get_bands(profile)
+    hit = np.flatnonzero((starts <= pos) & (pos < ends))
+    if len(hit) == 0:
+        return None
+    return starts[hit[0]], ends[hit[0]]
+
+
+def band_size(profile, pos):
+    band = get_band(profile, pos)
+    if band is None:
+        return 0
+    return band[1] - band[0]
+
+
+def estimate_char_size(ink, x, y):
+    # 点击位置的横向和纵向投影，横排文字的行高和竖排文字的列宽都是两个方向中较小的一个
+    r = max_char
+    window = ink[max(0, y - r):y + r, max(0, x - r):x + r]
+    wy = y - max(0, y - r)
+    wx = x - max(0, x - r)
+    height = band_size(window[:, max(0, wx - min_char):wx + min_char].any(axis=1), wy)
+    width = band_size(window[max(0, wy - min_char):wy + min_char].any(axis=0), wx)
+    sizes = [size for size in (height, width) if size > 0]
+    if not sizes:
+        return min_char
+    return int(np.clip(min(sizes), min_char, max_char))
+
+
+def find_bubble(ink_cells, x, y, char_cells):
+    # 从点击位置开始填充背景，没有碰到截取范围的边缘说明点击在一个封闭的对话框内
+    background = ~ink_cells
+    if background[y, x]:
+        seed_pos = x, y
+    else:
+        seed_pos = nearest(background, x, y, char_cells)
+        if seed_pos is None:
+            return None
+    seed = np.zeros_like(background)
+    seed[seed_pos[1], seed_pos[0]] = True
+    region = grow(seed, background)
+
+    h, w = region.shape
+    if region[0].any() or region[-1].any() or region[:, 0].any() or region[:, -1].any():
+        return None
+    left, top, right, bottom = get_box(region)
+    if max(right - left, bottom - top) < char_cells * 1.5:
+        # 点击在“口”“o”这样的字里面
+        return None
+    if not ink_cells[top:bottom, left:right].any():
+        return None
+    return left, top, right, bottom
+
+
+def find_block(ink_cells, x, y, char_cells):
+    # 膨胀后文字连成一片，取点击位置所在的连通区域，中日文字行间距小，横向和纵向都连接
+    r = max(1, round(char_cells * 0.5))
+    mask = dilate(ink_cells, r, r)
+    if not mask[y, x]:
+        return None
+    seed = np.zeros_like(mask)
+    seed[y, x] = True
+    region = grow(seed, mask) & ink_cells
+    if not region.any():
+        return None
+    left, top, right, bottom = get_box(region)
+
+    limit = char_cells * max_block // 2
+    left, right = clip_at_gap(region.any(axis=0), left, right, x - limit, x + limit)
+    top, bottom = clip_at_gap(region.any(axis=1), top, bottom, y - limit, y + limit)
+    return left, top, right, bottom
+
+
+def clip_at_gap(profile, start, end, low, high):
+    # 把[start, end)限制在[low, high)内，只在没有文字的位置截断，不会把一个字切开，找不到空白时不截断
+    if start < low:
+        blank = np.flatnonzero(~profile[low:end]) + low
+        if len(blank) > 0 and profile[blank[0]:end].any():
+            start = blank[0] + np.flatnonzero(profile[blank[0]:end])[0]
+    if end > high:
+        blank = np.flatnonzero(~profile[start:high]) + start
+        if len(blank) > 0 and profile[start:blank[-1]].any():
+            end = start + np.flatnonzero(profile[start:blank[-1]])[-1] + 1
+    return start, end
+
+
+def find_line(ink, x, y, size):
+    # 点击的一行的(上边界, 基线, 下边界)，点击位置左右较宽范围内的横向投影
+    # 上一行的下伸部分和下一行的上伸部分只有很少的像素，用较低的阈值分开相邻的行
+    window_top = max(0, y - max_char // 2)
+    window = ink[window_top:y + max_char // 2, max(0, x - max_char):x + max_char]
+    pos = y - window_top
+    # 只统计点击的一行左右两端之间的列，阈值只取点击位置附近的行，相邻的行更长时不会把这一行漏掉
+    near = slice(max(0, pos - size // 2), pos + size // 2 + 1)
+    cols = np.flatnonzero(window[near].any(axis=0))
+    if len(cols) == 0:
+        return None
+    profile = window[:, cols[0]:cols[-1] + 1].sum(axis=1)
+    peak = profile[near].max()
+    # T、M等大写字母的横笔和中间部分之间、下伸部分的末端和基线之间可能有几行低于阈值，间隔小于最高的一段的一半时合并
+    dense = profile >= peak * 0.15
+    starts, ends = get_runs(dense)
+    starts, ends = get_bands(dense, max(2, (ends - starts).max() // 2))
+    i = np.argmin(np.maximum(starts - pos, 0) + np.maximum(pos - ends + 1, 0))
+    start, end = starts[i], ends[i]
+    # i、j的点和下伸的尾巴可能低于阈值，向外扩展，不超过和相邻的行之间的中点
+    upper = (ends[i - 1] + start) // 2 if i > 0 else 0
+    lower = (end + starts[i + 1]) // 2 if i + 1 < len(starts) else len(profile)
+    top = max(upper, start - (end - start) // 2)
+    bottom = min(lower, end + (end - start) // 2)
+    rows = np.flatnonzero(profile[top:bottom])
+    top, bottom = top + rows[0], top + rows[-1] + 1
+    # 基线是最后一个比较密的行，下面只有g、j、p等字母的下伸部分
+    baseline = start + np.flatnonzero(profile[start:end] >= profile[start:end].max() * 0.4)[-1] + 1
+    return window_top + top, window_top + baseline, window_top + bottom
+
+
+def get_word_gap(gaps, line_height):
+    # 同一行的空白按大小排序，找出字母间距和单词间距之间最大的跳跃，找不到时用固定的比例
+    # 衬线字体的空格可能只有字号的0.2，等宽字体字母之间的空白可能有0.4，固定的比例不能适用所有字体
+    values = np.unique(gaps)
+    if len(values) >= 2:
+        # 小字号的空白只有几个像素，加1个像素的误差
+        ratios = values[1:] / (values[:-1] + 1)
+        valid = np.flatnonzero((values[1:] >= line_height * min_word_gap) & (values[1:] >= 2))
+        if len(valid) > 0:
+            i = valid[np.argmax(ratios[valid])]
+            if ratios[i] >= word_gap_jump:
+                return values[i + 1]
+    return max(2, line_height * word_gap)
+
+
+def find_word(ink, x, line):
+    # 横排的拉丁字母：按列投影找出点击的单词，只在明显大于字母间距的空白处分开，不会把一个字母切开
+    top, baseline, bottom = line
+    # 估计字号，只有大写字母时没有上伸和下伸部分，基线以上的高度大约是字号的3/4
+    line_height = max(bottom - top, (baseline - top) * 4 / 3)
+
+    # 只用基线以上的部分计算列投影，j、g、y的下伸部分经常伸到前一个单词的下面
+    starts, ends = get_runs(ink[top:baseline].any(axis=0))
+    if len(starts) == 0:
+        return None
+    gaps = starts[1:] - ends[:-1]
+    split = np.flatnonzero(gaps >= get_word_gap(gaps, line_height))
+    word_starts = starts[np.concatenate([[0], split + 1])]
+    word_ends = ends[np.concatenate([split, [len(ends) - 1]])]
+    hit = np.flatnonzero((word_starts <= x) & (x < word_ends))
+    if len(hit) == 0:
+        hit = [np.argmin(np.minimum(np.abs(word_starts - x), np.abs(word_ends - 1 - x)))]
+    i = hit[0]
+    left, right = word_starts[i], word_ends[i]
+
+    # j、y的下伸部分可能超出基线以上的范围，沿着基线以下连续的笔画向两边扩展，不超过相邻的单词
+    below_starts, below_ends = get_runs(ink[baseline:bottom].any(axis=0))
+    overlap = (below_starts < right) & (below_ends > left)
+    if overlap.any():
+        min_left = word_ends[i - 1] if i > 0 else 0
+        max_right = word_starts[i + 1] if i + 1 < len(word_starts) else ink.shape[1]
+        left = max(min_left, min(left, below_starts[overlap][0]))
+        right = min(max_right, max(right, below_ends[overlap][-1]))
+
+    rows = np.flatnonzero(ink[top:bottom, left:right].any(axis=1))
+    if len(rows) > 0:
+        top, bottom = top + rows[0], top + rows[-1] + 1
+    return left, top, right, bottom
+
+
+def find_text_box(img, x, y):
+    # 返回点击位置的单词或者对话框在img中的范围(left, top, right, bottom)，没有文字时返回None
+    a = np.asarray(img.convert('L'), dtype=np.float32)
+    h, w = a.shape
+    if not (0 <= x < w and 0 <= y < h):
+        return None
+    ink = get_ink(a, x, y)
+    seed = nearest(ink[max(0, y - max_char):y + max_char, max(0, x - max_char):x + max_char],
+                   x - max(0, x - max_char), y - max(0, y - max_char), background_radius)
+    if seed is None:
+        return None
+    sx, sy = seed[0] + max(0, x - max_char), seed[1] + max(0, y - max_char)
+
+    char_size = estimate_char_size(ink, sx, sy)
+    # 取点击位置所在的一行判断书写系统，只有确定是中日文字时才取整个对话框或者文字块
+    # 竖排文字的一行会很高，直接按中日文字处理
+    line = find_line(ink, sx, sy, char_size)
+    if line is not None and line[2] - line[0] <= max_char:
+        crop = img.crop((max(0, sx - char_size * 4), line[0], sx + char_size * 4, line[2]))
+        if classify_image(crop) != 'cjk':
+            box = find_word(ink, sx, line)
+            if box is None:
+                return None
+            left, top, right, bottom = box
+            return max(0, left - padding), max(0, top - padding), min(w, right + padding), min(h, bottom + padding)
+
+    ink_cells = shrink(ink)
+    cx, cy = sx // cell, sy // cell
+    char_cells = max(1, char_size // cell)
+    box = find_bubble(ink_cells, x // cell, y // cell, char_cells)
+    if box is None:
+        box = find_block(ink_cells, cx, cy, char_cells)
+    if box is None:
+        return None
+    left, top, right, bottom = box
+    return (max(0, left * cell - padding), max(0, top * cell - padding),
+            min(w, right * cell + padding), min(h, bottom * cell + padding))
+
+
+def crop_click_word(img, x, y, scale=1):
+    # x, y是点击位置在img中的像素坐标
+    x = int(x)
+    y = int(y)
+    left, top, right, bottom = get_click_region(img.width, img.height, x, y, scale)
+    region = img.crop((left, top, right, bottom))
+    box = find_text_box(region, x - left, y - top)
+    if box is None:
+        return None
+    return region.crop(box)
@@ -11,6 +11,26 @@ default_config = {
         'HOST': '127.0.0.1',
         'PORT': '18000',
         'PATH': 'mdict/simple2'
+    },
+    'OCR': {
+        'WORKERS': '1',
+        'CACHE_SIZE': '256',
+        'CACHE_FILE': 'ocr_cache.json',
+        'TESSERACT_BACKEND': 'api',
+        'PREPROCESS': 'gray,invert,trim,upscale,pad',
+        'TESSERACT_MIN_CONF': '0',
+        'RACE_THRESHOLD': '0.8',
+        'HOVER_KEY': 'shift',
+        'HOVER_INTERVAL': '150',
+        'THREADS': 'auto',
+        'INTEROP_THREADS': '1',
+        'RESERVE_CORES': '1',
+        'TESSERACT_THREADS': '1',
+        'IDLE_UNLOAD': '600',
+        'MEMORY_PRESSURE': '90',
+        'CAPTURE_BACKEND': 'auto',
+        'PREVIEW_FRAMES': '0',
+        'PREVIEW_FPS': '2'
     }
 }
 
@@ -32,15 +52,17 @@ def get_config():
 
     if os.path.exists(user_config_path):
         config.read(user_config_path, encoding='utf-8')
-        if 'GENERAL' in config.keys():
-            for k, v in default_config['GENERAL'].items():
-                if k not in config['GENERAL'].keys():
-                    config['GENERAL'][k] = str(v)
-        else:
-            config['GENERAL'] = default_config['GENERAL']
-            create_config()
+        for sec, items in default_config.items():
+            if sec in config.keys():
+                for k, v in items.items():
+                    if k not in config[sec].keys():
+                        config[sec][k] = str(v)
+            else:
+                config[sec] = items
+                create_config()
     else:
-        config['GENERAL'] = default_config['GENERAL']
+        for sec, items in default_config.items():
+            config[sec] = items
         create_config()
     return config
 
@@ -55,7 +77,8 @@ def set_config(sec, save_config):
 
 
 if not os.path.exists(user_config_path):
-    config['GENERAL'] = default_config['GENERAL']
+    for sec, items in default_config.items():
+        config[sec] = items
     create_config()
 
 config.read(user_config_path, encoding='utf-8')
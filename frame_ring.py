@@ -0,0 +1,115 @@
+import time
+import threading
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+from screen_capture import create_capture
+
+# 截屏查词的预览帧：后台线程以较低的帧率截取鼠标所在的屏幕，保存最近几帧
+# 按下截屏快捷键时直接用最新的一帧显示截图窗口，松开鼠标时再重新截取选中的范围
+# 每一帧的内存预先分配，屏幕大小不变时重复使用，不会每次截图都申请几十MB的内存
+# 此模块不导入Qt，屏幕位置由主线程通过set_screen传入
+
+
+class FrameRing:
+    def __init__(self, count):
+        self.count = max(2, count)
+        self.buffers = [None] * self.count
+        self.frames = [None] * self.count
+        # (屏幕, 宽, 高, 截图时间)
+        self.index = -1
+        self.lock = threading.Lock()
+
+    def get_buffer(self, slot, size):
+        buffer = self.buffers[slot]
+        if buffer is None or buffer.size < size:
+            if buffer is not None:
+                buffer.close()
+                buffer.unlink()
+            buffer = shared_memory.SharedMemory(create=True, size=size)
+            self.buffers[slot] = buffer
+        return buffer
+
+    def write(self, img, screen):
+        data = img.convert('RGB').tobytes()
+        slot = (self.index + 1) % self.count
+        with self.lock:
+            buffer = self.get_buffer(slot, len(data))
+            buffer.buf[:len(data)] = data
+            self.frames[slot] = (screen, img.width, img.height, time.time())
+            self.index = slot
+
+    def latest(self):
+        # 返回最新一帧的(截图, 屏幕, 截图时间)，截图是复制的，后台线程继续写入不受影响
+        with self.lock:
+            if self.index < 0:
+                return None
+            screen, width, height, timestamp = self.frames[self.index]
+            img = Image.frombytes('RGB', (width, height), self.buffers[self.index].buf[:width * height * 3])
+        return img, screen, timestamp
+
+    def clear(self):
+        with self.lock:
+            self.frames = [None] * self.count
+            self.index = -1
+
+    def close(self):
+        with self.lock:
+            for buffer in self.buffers:
+                if buffer is not None:
+                    buffer.close()
+                    buffer.unlink()
+            self.buffers = [None] * self.count
+            self.frames = [None] * self.count
+            self.index = -1
+
+
+class FrameCapturer(threading.Thread):
+    def __init__(self, backend='auto', frames=3, fps=2.0):
+        super().__init__(daemon=True)
+        self.backend = backend
+        self.interval = 1 / max(0.1, fps)
+        self.ring = FrameRing(frames)
+        self.screen = None
+        # (sx, sy, sw, sh, sc)，None时暂停截图
+        self.stop_event = threading.Event()
+
+    def set_screen(self, screen):
+        if screen != self.screen:
+            # 换了屏幕，旧的帧不能再用
+            self.ring.clear()
+        self.screen = screen
+
+    def latest(self, screen, max_age):
+        frame = self.ring.latest()
+        if frame is None:
+            return None
+        img, frame_screen, timestamp = frame
+        if frame_screen != screen or time.time() - timestamp > max_age:
+            return None
+        return img
+
+    def run(self):
+        # 截图对象在线程中创建，X11的连接不能跨线程使用
+        capture = create_capture(self.backend)
+        try:
+            while not self.stop_event.wait(self.interval):
+                screen = self.screen
+                if screen is None:
+                    continue
+                sx, sy, sw, sh, sc = screen
+                try:
+                    img = capture.grab(int(sx), int(sy), int(sw * sc), int(sh * sc))
+                except Exception as e:
+                    print('frame capture error', e)
+                    continue
+                self.ring.write(img, screen)
+        finally:
+            capture.close()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join(2)
+        self.ring.close()
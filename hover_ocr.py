@@ -0,0 +1,112 @@
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from click_detect import region_size
+
+# 悬停取词：按住修饰键时定时截取鼠标周围的区域，识别鼠标下的单词
+# 区域按屏幕上固定的网格分成小块，每块计算一个crc32，和上一帧比较
+# 画面没有变化、鼠标还在上次的单词范围内时什么都不做；单词覆盖的小块都没变时直接使用上次识别的文字
+
+tile_size = 64
+static_skip = 3
+# 鼠标没有移动、画面连续几帧没有变化时，每static_skip + 1次定时只截图一次
+
+
+def tile_hashes(a):
+    # a是按网格对齐的截图数组，返回{(行, 列): crc32}
+    h, w = a.shape[:2]
+    rows, cols = h // tile_size, w // tile_size
+    tiles = a[:rows * tile_size, :cols * tile_size].reshape(rows, tile_size, cols, tile_size, -1)
+    tiles = np.ascontiguousarray(tiles.transpose(0, 2, 1, 3, 4))
+    return {(r, c): zlib.crc32(tiles[r, c].tobytes()) for r in range(rows) for c in range(cols)}
+
+
+class HoverTracker:
+    def __init__(self, cache_size=128):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        # 单词覆盖的小块的哈希 -> 识别的文字
+        self.tiles = {}
+        # 上一帧每个小块的哈希，键是(屏幕, 小块的屏幕坐标)
+        self.last_box = None
+        # 上一次识别的单词的屏幕范围
+        self.last_key = None
+        self.static_frames = 0
+        self.skipped = 0
+        self.last_pos = None
+
+    def should_capture(self, pos):
+        if pos != self.last_pos:
+            self.last_pos = pos
+            self.skipped = 0
+            return True
+        if self.static_frames <= static_skip or self.skipped >= static_skip:
+            self.skipped = 0
+            return True
+        self.skipped += 1
+        return False
+
+    def get_region(self, width, height, x, y, scale=1):
+        # 鼠标周围的截取范围，左上角对齐到网格，保证鼠标移动时同一个位置的小块不变
+        w = min(width, round(region_size[0] * scale)) // tile_size * tile_size
+        h = min(height, round(region_size[1] * scale)) // tile_size * tile_size
+        left = max(0, min(int(x) - w // 2, width - w)) // tile_size * tile_size
+        top = max(0, min(int(y) - h // 2, height - h)) // tile_size * tile_size
+        return left, top, left + w, top + h
+
+    def update(self, region, screen, left, top):
+        # 返回这一帧是否有变化的小块
+        hashes = tile_hashes(np.asarray(region.convert('RGB')))
+        changed = False
+        for (r, c), value in hashes.items():
+            key = (screen, left + c * tile_size, top + r * tile_size)
+            if self.tiles.get(key) != value:
+                self.tiles[key] = value
+                changed = True
+        if len(self.tiles) > len(hashes) * 16:
+            # 只保留最近的小块
+            self.tiles = {(screen, left + c * tile_size, top + r * tile_size): value
+                          for (r, c), value in hashes.items()}
+        self.static_frames = 0 if changed else self.static_frames + 1
+        return changed
+
+    def in_last_box(self, screen, x, y):
+        if self.last_box is None:
+            return False
+        box_screen, left, top, right, bottom = self.last_box
+        return box_screen == screen and left <= x < right and top <= y < bottom
+
+    def word_key(self, screen, left, top, right, bottom):
+        # 单词所在的小块和它们的哈希，加上单词在小块中的位置
+        tiles = []
+        for ty in range(top // tile_size * tile_size, bottom, tile_size):
+            for tx in range(left // tile_size * tile_size, right, tile_size):
+                tiles.append((tx, ty, self.tiles.get((screen, tx, ty))))
+        return screen, left, top, right, bottom, tuple(tiles)
+
+    def set_word(self, screen, box, key):
+        # 返回是否和上一次是同一个单词
+        self.last_box = (screen,) + tuple(box)
+        if key == self.last_key:
+            return False
+        self.last_key = key
+        return True
+
+    def reset(self):
+        self.last_box = None
+        self.last_key = None
+        self.last_pos = None
+
+    def get(self, key):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        return None
+
+    def put(self, key, text):
+        self.cache[key] = text
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
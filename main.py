@@ -4,18 +4,23 @@
 """PySide6 port of the Qt WebEngineWidgets Simple Browser example from Qt v6.x"""
 
 import sys
+import multiprocessing
 from argparse import ArgumentParser, RawTextHelpFormatter
 
-from PySide6.QtWebEngineCore import QWebEngineProfile, QWebEngineSettings
-from PySide6.QtWidgets import QApplication
-from PySide6.QtGui import QIcon, QPixmap, QFont
-from PySide6.QtCore import QCoreApplication, QLoggingCategory, QUrl, Qt
+# OCR子进程在windows上用spawn启动，会重新导入__main__
+# Qt和浏览器相关的模块只在主进程中导入，否则每个OCR子进程都会加载整个界面
 
-from browser import Browser, MySplashScreen
 
-import data.rc_simplebrowser
+def main():
+    from PySide6.QtWebEngineCore import QWebEngineProfile, QWebEngineSettings
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtGui import QIcon, QPixmap, QFont
+    from PySide6.QtCore import QCoreApplication, QLoggingCategory, QUrl, Qt
+
+    from browser import Browser, MySplashScreen
+
+    import data.rc_simplebrowser
 
-if __name__ == "__main__":
     parser = ArgumentParser(description="Django Mdict",
                             formatter_class=RawTextHelpFormatter)
     parser.add_argument("url", type=str, nargs="?", help="URL")
@@ -49,4 +54,10 @@ if __name__ == "__main__":
 
     splash.finish(window)  # 隐藏启动界面
     splash.deleteLater()
-    sys.exit(app.exec())
+    return app.exec()
+
+
+if __name__ == "__main__":
+    # 打包成exe后子进程也从exe启动，需要freeze_support
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import math
+from pathlib import Path
+
+import torch
+from PIL import Image
+from transformers import StoppingCriteria, StoppingCriteriaList
+from manga_ocr import MangaOcr
+from manga_ocr.ocr import post_process
+
+from ocr_decode import is_repeating, repeat_window
+
+
+class RepeatStoppingCriteria(StoppingCriteria):
+    # 某一行陷入重复循环时停止这一行的解码
+    # 返回每一行是否结束的bool张量，transformers 4.39开始支持，requirements.txt中限制了最低版本
+    def __call__(self, input_ids, scores, **kwargs):
+        window = repeat_window()
+        done = [is_repeating(row[-window:].tolist()) for row in input_ids]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class MangaOcrEngine(MangaOcr):
+    # 在MangaOcr的基础上增加批量识别，限制解码长度
+    max_batch_size = 8
+    max_length = 300
+    # 最多解码的字符数，不包括开始和结束的token
+
+    def __call__(self, img_or_path):
+        x = self._preprocess(self._load_image(img_or_path))
+        with torch.inference_mode():
+            x = self._generate(x[None])[0].cpu()
+        return self._decode(x)
+
+    def recognize_scored(self, img_or_path):
+        # 返回(文字, 置信度)，置信度是每个token概率的几何平均，0到1
+        x = self._preprocess(self._load_image(img_or_path))
+        with torch.inference_mode():
+            out = self._generate(x[None], return_dict_in_generate=True, output_scores=True)
+            text = self._decode(out.sequences[0].cpu())
+            if text == '':
+                return text, 0.0
+            if getattr(out, 'sequences_scores', None) is not None:
+                # beam search的分数已经是按长度平均的对数概率
+                score = float(out.sequences_scores[0])
+            else:
+                scores = self.model.compute_transition_scores(out.sequences, out.scores, normalize_logits=True)
+                score = float(scores[0].mean())
+        return text, math.exp(score)
+
+    def _load_image(self, img_or_path):
+        if isinstance(img_or_path, str) or isinstance(img_or_path, Path):
+            img = Image.open(img_or_path)
+        elif isinstance(img_or_path, Image.Image):
+            img = img_or_path
+        else:
+            raise ValueError(f'img_or_path must be a path or PIL.Image, instead got: {img_or_path}')
+        return img.convert('L').convert('RGB')
+
+    def _generate(self, pixel_values, **kwargs):
+        return self.model.generate(pixel_values.to(self.model.device), max_length=self.max_length + 2,
+                                   stopping_criteria=StoppingCriteriaList([RepeatStoppingCriteria()]), **kwargs)
+
+    def _decode(self, token_ids):
+        # 没有解码到eos说明文字超过了max_length或者陷入了重复循环，直接返回空字符串
+        if not (token_ids == self.model.config.eos_token_id).any():
+            return ''
+        return post_process(self.tokenizer.decode(token_ids, skip_special_tokens=True))
+
+    def recognize_batch(self, images):
+        texts = []
+        for i in range(0, len(images), self.max_batch_size):
+            texts.extend(self._recognize_batch(images[i:i + self.max_batch_size]))
+        return texts
+
+    def _recognize_batch(self, images):
+        # processor把每张截图缩放到同样的尺寸，可以直接堆叠成一个batch，encoder只运行一次
+        # 批量时用贪心解码，已经输出eos的序列由generate补pad
+        imgs = [img.convert('L').convert('RGB') for img in images]
+        pixel_values = self.processor(imgs, return_tensors='pt').pixel_values
+        with torch.inference_mode():
+            token_ids = self._generate(pixel_values, num_beams=1, do_sample=False)
+        return [self._decode(x) for x in token_ids.cpu()]
@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import psutil
+from PIL import Image, ImageDraw, ImageFont
+
+from ocr_metrics import load_corpus, char_error_rate, percentile
+from ocr_preprocess import default_steps
+import ocr_worker
+
+# OCR引擎的离线性能测试，不需要显示器，不导入Qt
+# 每个配置在单独的子进程中运行，线程数设置互不影响，峰值内存也是单独统计的
+# python ocr_benchmark.py path/to/corpus --engines manga-ocr,pytesseract --threads 1,2,4 --psm auto,6 --json out.json
+# python ocr_benchmark.py path/to/corpus --baseline out.json  超过允许的退化时返回1
+# python ocr_benchmark.py --engines manga-ocr-onnx --batch 1,4,8  比较逐张识别和recognize_batch批量识别
+# 不指定测试集时使用data/ocr-samples
+
+root_path = os.path.dirname(os.path.abspath(__file__))
+tessdata_path = os.path.join(root_path, 'data', 'tessdata')
+sample_path = os.path.join(root_path, 'data', 'ocr-samples')
+
+executor_engines = ['manga-ocr', 'manga-ocr-onnx', 'manga-ocr-int8', 'manga-ocr-bf16']
+
+
+def make_synthetic_corpus(corpus_path, count=20):
+    # 没有测试集时生成一组拉丁字母和数字的图片，只能用来比较速度和tesseract的基本准确率
+    os.makedirs(corpus_path, exist_ok=True)
+    font = ImageFont.load_default()
+    words = ['dictionary', 'lookup', 'screen', 'capture', 'window', 'manga', 'reader', 'tesseract', 'language',
+             'benchmark', '2024', '12345', 'Django', 'Mdict', 'latency', 'throughput']
+    for i in range(count):
+        text = ' '.join(words[(i + j) % len(words)] for j in range(1 + i % 3))
+        img = Image.new('RGB', (12 + 7 * len(text), 28), 'white')
+        ImageDraw.Draw(img).text((6, 8), text, fill='black', font=font)
+        img.save(os.path.join(corpus_path, f'{i:03d}.png'))
+        with open(os.path.join(corpus_path, f'{i:03d}.txt'), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def get_variants(engines, threads_list, psm_list, lang_list, batch_list):
+    import thread_budget
+    variants = []
+    for engine in engines:
+        for threads in threads_list:
+            # auto和程序中一样，给渲染保留一个核
+            threads = thread_budget.get_ocr_threads(threads)
+            if engine == 'pytesseract':
+                for psm in psm_list:
+                    for lang in lang_list:
+                        variants.append({'name': f'{engine} t{threads} psm-{psm} {lang}', 'engine': engine,
+                                         'threads': threads, 'psm': psm, 'lang': lang})
+            elif engine in executor_engines:
+                for batch in batch_list:
+                    # 逐张识别的名称不变，可以和以前的基准结果比较
+                    batch = max(1, int(batch))
+                    name = f'{engine} t{threads}' if batch == 1 else f'{engine} t{threads} b{batch}'
+                    variants.append({'name': name, 'engine': engine, 'threads': threads, 'batch': batch})
+            else:
+                raise Exception(f'unknown ocr engine {engine}')
+    return variants
+
+
+def get_peak_rss():
+    info = psutil.Process(os.getpid()).memory_info()
+    # windows有峰值工作集，linux从getrusage读取，单位是KB
+    if hasattr(info, 'peak_wset'):
+        return info.peak_wset
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_variant(variant, max_length):
+    # 返回的函数输入一组图片，返回同样数量的文字
+    threads = variant['threads']
+    if variant['engine'] == 'pytesseract':
+        import thread_budget
+        from tesseract_engine import create_tesseract, recognize_text
+        from text_layout import detect_layout, layout_psm
+
+        thread_budget.set_omp_threads(threads)
+        tesseract = create_tesseract('api', tessdata_path if os.path.isdir(tessdata_path) else None)
+
+        def recognize_one(img):
+            psm = variant['psm']
+            psm = layout_psm[detect_layout(img)[0]] if psm == 'auto' else int(psm)
+            return recognize_text(tesseract, img, variant['lang'], psm)[0]
+
+        def recognize(images):
+            return [recognize_one(img) for img in images]
+        return recognize
+
+    ocr_worker.init_worker(variant['engine'], ocr_worker.model_path, max_length, threads)
+
+    def recognize(images):
+        if len(images) == 1:
+            return [ocr_worker.run_ocr(0, images[0])[1]]
+        return ocr_worker.run_ocr_batch(0, images)[1]
+    return recognize
+
+
+def run_variant(variant, corpus_path, steps, max_length):
+    # 在子进程中运行，有些引擎的异常无法pickle，转成字符串返回
+    try:
+        return benchmark_variant(variant, corpus_path, steps, max_length)
+    except Exception as e:
+        result = dict(variant)
+        result['error'] = f'{type(e).__name__}: {e}'
+        return result
+
+
+def benchmark_variant(variant, corpus_path, steps, max_length):
+    from ocr_preprocess import preprocess
+
+    corpus = load_corpus(corpus_path)
+    batch = variant.get('batch', 1)
+    t1 = time.perf_counter()
+    recognize = load_variant(variant, max_length)
+    load_time = time.perf_counter() - t1
+    # 第一批图片先识别一次，不计入耗时，tesseract在第一次识别时加载语言模型
+    recognize([preprocess(img, steps) for name, img, label in corpus[:batch]])
+
+    predictions = []
+    latencies = []
+    t1 = time.perf_counter()
+    for i in range(0, len(corpus), batch):
+        t2 = time.perf_counter()
+        images = [preprocess(img, steps) for name, img, label in corpus[i:i + batch]]
+        predictions.extend(recognize(images))
+        # 批量识别时每张图片的耗时是整批的耗时，用户要等整批识别完才能看到结果
+        latencies.extend([(time.perf_counter() - t2) * 1000] * len(images))
+    total = time.perf_counter() - t1
+
+    labels = [label for name, img, label in corpus]
+    result = dict(variant)
+    result.update({
+        'load_s': load_time,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'max_ms': max(latencies),
+        'throughput': len(corpus) / total,
+        'peak_rss_mb': get_peak_rss() / 1024 / 1024,
+        'cer': char_error_rate(predictions, labels),
+    })
+    return result
+
+
+def check_regression(results, baseline_file, latency_tolerance, cer_tolerance):
+    # 和基准结果中同名的配置比较，返回超出允许范围的项目
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = {variant['name']: variant for variant in json.load(f)['variants']}
+    failures = []
+    for result in results:
+        base = baseline.get(result['name'])
+        if base is None or 'error' in base:
+            continue
+        if 'error' in result:
+            failures.append(f'{result["name"]}: {result["error"]}')
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + latency_tolerance):
+            failures.append(f'{result["name"]}: p95 {base["p95_ms"]:.1f}ms -> {result["p95_ms"]:.1f}ms')
+        if result['cer'] > base['cer'] + cer_tolerance:
+            failures.append(f'{result["name"]}: CER {base["cer"]:.4f} -> {result["cer"]:.4f}')
+    return failures
+
+
+def print_table(results):
+    print(f'{"variant":<40}{"CER":>8}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}{"img/s":>8}{"peak MB":>10}'
+          f'{"load s":>8}')
+    for result in results:
+        if 'error' in result:
+            print(f'{result["name"]:<40}  error: {result["error"]}')
+            continue
+        print(f'{result["name"]:<40}{result["cer"]:>8.4f}{result["p50_ms"]:>10.1f}{result["p95_ms"]:>10.1f}'
+              f'{result["max_ms"]:>10.1f}{result["throughput"]:>8.2f}{result["peak_rss_mb"]:>10.1f}'
+              f'{result["load_s"]:>8.1f}')
+
+
+def split_list(value):
+    return [item.strip() for item in value.split(',') if item.strip() != '']
+
+
+def main():
+    parser = ArgumentParser(description='offline ocr benchmark')
+    parser.add_argument('corpus', type=str, nargs='?', default='',
+                        help='directory of images with .txt labels, defaults to data/ocr-samples, a synthetic corpus '
+                             'is generated if that is missing')
+    parser.add_argument('--engines', type=str, default='manga-ocr,pytesseract',
+                        help=f'comma separated, any of {",".join(executor_engines)},pytesseract')
+    parser.add_argument('--threads', type=str, default='1', help='comma separated thread counts')
+    parser.add_argument('--psm', type=str, default='auto', help='comma separated tesseract psm, auto uses the '
+                                                                'layout detection of the app')
+    parser.add_argument('--langs', type=str, default='eng+jpn+chi_sim', help='comma separated tesseract languages')
+    parser.add_argument('--preprocess', type=str, default=default_steps, help='preprocess steps, empty to disable')
+    parser.add_argument('--batch', type=str, default='1',
+                        help='comma separated batch sizes for manga-ocr engines, above 1 uses recognize_batch')
+    parser.add_argument('--max-length', type=int, default=50, help='manga-ocr max decode length')
+    parser.add_argument('--json', type=str, default='', help='write the results to this file')
+    parser.add_argument('--baseline', type=str, default='', help='results json to compare against')
+    parser.add_argument('--latency-tolerance', type=float, default=0.2,
+                        help='allowed relative p95 latency increase over the baseline')
+    parser.add_argument('--cer-tolerance', type=float, default=0.01,
+                        help='allowed absolute CER increase over the baseline')
+    args = parser.parse_args()
+
+    corpus_path = args.corpus
+    if corpus_path == '' and os.path.isdir(sample_path):
+        corpus_path = sample_path
+    if corpus_path == '':
+        corpus_path = os.path.join(tempfile.gettempdir(), 'ocr-benchmark-corpus')
+        make_synthetic_corpus(corpus_path)
+        print('synthetic corpus', corpus_path)
+    count = len(load_corpus(corpus_path))
+    if count == 0:
+        print('empty corpus')
+        return 1
+
+    variants = get_variants(split_list(args.engines), split_list(args.threads), split_list(args.psm),
+                            split_list(args.langs), split_list(args.batch))
+    results = []
+    # spawn启动的子进程不继承父进程已经导入的模块和线程设置
+    context = multiprocessing.get_context('spawn')
+    for variant in variants:
+        print('run', variant['name'])
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                results.append(pool.submit(run_variant, variant, corpus_path, args.preprocess,
+                                           args.max_length).result())
+            except Exception as e:
+                result = dict(variant)
+                result['error'] = str(e)
+                results.append(result)
+
+    print(f'{count} images')
+    print_table(results)
+
+    if args.json != '':
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'corpus': corpus_path, 'images': count, 'variants': results}, f, ensure_ascii=False,
+                      indent=2)
+
+    if args.baseline != '':
+        failures = check_regression(results, args.baseline, args.latency_tolerance, args.cer_tolerance)
+        for failure in failures:
+            print('regression', failure)
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
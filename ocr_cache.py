@@ -0,0 +1,74 @@
+import os
+import json
+from collections import OrderedDict
+
+from PIL import Image
+
+# 截屏查词的结果缓存，键是截图的感知哈希加上OCR引擎和语言
+# 同一个气泡或标签多次截图时，截图范围略有不同也能命中
+
+
+def dhash(img, hash_size=16):
+    # difference hash：缩小成(hash_size+1)*hash_size的灰度图，比较每行相邻像素的亮度
+    img = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(img.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f'{value:0{hash_size * hash_size // 4}x}'
+
+
+class OcrCache:
+    def __init__(self, max_size=256, cache_file=''):
+        self.max_size = max(1, max_size)
+        self.cache_file = cache_file
+        self.items = OrderedDict()
+        self.changed = False
+        self.load()
+
+    def make_key(self, img, engine, lang):
+        return f'{engine}|{lang}|{dhash(img)}'
+
+    def get(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        return None
+
+    def put(self, key, text):
+        self.items[key] = text
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+        self.changed = True
+
+    def clear(self):
+        self.items.clear()
+        self.changed = True
+
+    def load(self):
+        if self.cache_file == '' or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+            for key, text in items:
+                self.items[key] = text
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+        except (OSError, ValueError) as e:
+            print('load ocr cache error', e)
+
+    def save(self):
+        if self.cache_file == '' or not self.changed:
+            return
+        try:
+            tmp_file = f'{self.cache_file}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(list(self.items.items()), f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+            self.changed = False
+        except OSError as e:
+            print('save ocr cache error', e)
@@ -0,0 +1,18 @@
+# 解码时的提前终止条件，torch和onnxruntime两种引擎共用，不要导入torch
+
+
+def is_repeating(token_ids, repeat=6, max_period=4):
+    # 末尾是同一个长度不超过max_period的片段连续重复repeat次，说明解码陷入了循环
+    for period in range(1, max_period + 1):
+        n = period * repeat
+        if len(token_ids) < n:
+            break
+        tail = token_ids[-n:]
+        if all(tail[i] == tail[i % period] for i in range(period, n)):
+            return True
+    return False
+
+
+def repeat_window(repeat=6, max_period=4):
+    # is_repeating只需要看末尾这么多个token
+    return repeat * max_period
@@ -0,0 +1,368 @@
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+from ocr_metrics import percentile
+from tesseract_engine import recognize_text
+from text_layout import layout_psm, manga_ocr_rotated, rotate_for_manga_ocr
+
+# OCR引擎的统一接口，托盘菜单、截屏查词和路由都通过注册表使用引擎
+
+
+class OcrEngine(QObject):
+    result_ready = Signal(int, str, float)
+    # request_id, 文字, 置信度（0到1）
+    error_occurred = Signal(int, str)
+    state_changed = Signal(str)
+
+    name = ''
+    scripts = ('latin', 'kana', 'han', 'cjk')
+    # 能识别的书写系统
+    expected_latency = 500
+    # 没有统计数据时假定的耗时，毫秒
+    routable = True
+    # auto模式下是否可以被OcrRouter选中
+
+    def load(self):
+        pass
+
+    def unload(self):
+        pass
+
+    def state(self):
+        return 'ready'
+
+    def is_available(self):
+        return self.state() == 'ready'
+
+    def supports(self, script):
+        return script is None or script in self.scripts
+
+    def lang_key(self, options):
+        # OCR结果缓存中区分语言设置
+        return ''
+
+    def recognize(self, request_id, img, options):
+        # 结果通过result_ready或者error_occurred返回，可以在调用返回之前就发出
+        raise NotImplementedError
+
+    def cancel(self, request_id):
+        # 取消还在排队的请求，已经开始识别的请求无法中断，结果由调用者丢弃
+        pass
+
+    def result_source(self):
+        # 最近一次结果实际来自哪个引擎
+        return self.name
+
+
+class ExecutorOcrEngine(OcrEngine):
+    # manga-ocr系列引擎，共用一个OcrExecutor，同一时间只有一个模型在子进程中加载
+    scripts = ('kana', 'han', 'cjk')
+
+    def __init__(self, name, executor, expected_latency=500, parent=None):
+        super().__init__(parent)
+        self.name = name
+        self.executor = executor
+        self.expected_latency = expected_latency
+
+        self.executor.result_ready.connect(self._handle_result)
+        self.executor.error_occurred.connect(self._handle_error)
+        self.executor.state_changed.connect(self._handle_state_changed)
+
+    def is_current(self):
+        return self.executor.engine == self.name
+
+    def load(self):
+        self.executor.set_engine(self.name)
+        self.executor.start()
+
+    def unload(self):
+        if self.is_current():
+            self.executor.shutdown()
+
+    def state(self):
+        if self.is_current():
+            return self.executor.state
+        return 'unloaded'
+
+    def lang_key(self, options):
+        # 竖排的拉丁字母旋转后再识别，结果和不旋转不同
+        if manga_ocr_rotated(options.get('layout'), options.get('script')):
+            return 'jpn|rotated'
+        return 'jpn'
+
+    def recognize(self, request_id, img, options):
+        img = rotate_for_manga_ocr(img, options.get('layout'), options.get('script'))
+        self.executor.submit(request_id, img)
+
+    def cancel(self, request_id):
+        self.executor.cancel(request_id)
+
+    @Slot(int, str, float)
+    def _handle_result(self, request_id, text, conf):
+        if self.is_current():
+            self.result_ready.emit(request_id, text, conf)
+
+    @Slot(int, str)
+    def _handle_error(self, request_id, error):
+        if self.is_current():
+            self.error_occurred.emit(request_id, error)
+
+    @Slot(str)
+    def _handle_state_changed(self, state):
+        self.state_changed.emit(self.state())
+
+
+class TesseractOcrEngine(OcrEngine):
+    # tesseract在单独的线程中识别，不阻塞GUI线程，同一个tesseract句柄只在这个线程中使用
+    expected_latency = 300
+    _future_done = Signal(object)
+
+    def __init__(self, tesseract, lang_con, min_conf=0, parent=None):
+        super().__init__(parent)
+        self.name = 'pytesseract'
+        self.tesseract = tesseract
+        self.lang_con = lang_con
+        self.min_conf = min_conf
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.request_id = 0
+        self.pending = {}
+
+        self._future_done.connect(self._handle_future_done)
+
+    def get_params(self, options):
+        # 实际使用的语言和psm，识别和缓存的key都用这里的结果
+        return options.get('lang', self.lang_con), layout_psm.get(options.get('layout'), 6)
+
+    def lang_key(self, options):
+        lang, psm = self.get_params(options)
+        return f'{lang}|psm{psm}'
+
+    def recognize(self, request_id, img, options):
+        # 和OcrExecutor一样，后提交的请求优先
+        for pending_id in list(self.pending):
+            self.cancel(pending_id)
+        self.request_id = request_id
+        future = self.pool.submit(self._recognize, request_id, img, options)
+        self.pending[request_id] = future
+        future.add_done_callback(self._future_done.emit)
+
+    def _recognize(self, request_id, img, options):
+        lang, psm = self.get_params(options)
+        text, conf = recognize_text(self.tesseract, img, lang, psm, self.min_conf)
+        return request_id, text, conf
+
+    def cancel(self, request_id):
+        future = self.pending.get(request_id)
+        if future is not None and future.cancel():
+            del self.pending[request_id]
+
+    @Slot(object)
+    def _handle_future_done(self, future):
+        if future.cancelled():
+            return
+        request_id = None
+        for pending_id, pending_future in list(self.pending.items()):
+            if pending_future is future:
+                request_id = pending_id
+                del self.pending[pending_id]
+        try:
+            request_id, text, conf = future.result()
+        except Exception as e:
+            self.error_occurred.emit(request_id, str(e))
+            return
+        if request_id == self.request_id:
+            self.result_ready.emit(request_id, text, conf)
+        else:
+            print('drop stale ocr result', request_id)
+
+    def unload(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.tesseract.close()
+
+
+class RaceOcrEngine(OcrEngine):
+    # 同一张截图同时交给manga-ocr和tesseract识别，先返回且置信度达到阈值的结果胜出，另一个请求取消
+    # 两个结果都没有达到阈值时，等全部返回后取置信度高的
+    routable = False
+    # 会占用更多的CPU，只在托盘菜单中选择时使用
+
+    def __init__(self, engines, threshold=0.8, parent=None):
+        super().__init__(parent)
+        self.name = 'race'
+        self.engines = engines
+        self.threshold = threshold
+        self.expected_latency = min(engine.expected_latency for engine in engines)
+        self.request_id = None
+        self.running = []
+        self.results = []
+        # 没有达到阈值的结果(置信度, 文字, 引擎名)
+        self.winner = ''
+
+        for engine in self.engines:
+            engine.result_ready.connect(partial(self._handle_result, engine))
+            engine.error_occurred.connect(partial(self._handle_error, engine))
+            engine.state_changed.connect(self._handle_state_changed)
+
+    def members(self):
+        return [engine for engine in self.engines if engine.is_available()]
+
+    def state(self):
+        return 'ready' if self.members() else 'unloaded'
+
+    def supports(self, script):
+        return any(engine.supports(script) for engine in self.engines)
+
+    def lang_key(self, options):
+        return '|'.join(engine.lang_key(options) for engine in self.members())
+
+    def recognize(self, request_id, img, options):
+        members = self.members()
+        if not members:
+            self.error_occurred.emit(request_id, 'no ocr engine available')
+            return
+        self.request_id = request_id
+        self.running = [engine.name for engine in members]
+        self.results = []
+        for engine in members:
+            engine.recognize(request_id, img, options)
+
+    def cancel(self, request_id):
+        for engine in self.engines:
+            engine.cancel(request_id)
+
+    def result_source(self):
+        return self.winner
+
+    def _finish(self, request_id, text, conf, winner):
+        self.request_id = None
+        self.winner = winner
+        self.cancel(request_id)
+        self.result_ready.emit(request_id, text, conf)
+
+    def _handle_result(self, engine, request_id, text, conf):
+        if request_id != self.request_id or engine.name not in self.running:
+            return
+        self.running.remove(engine.name)
+        if conf >= self.threshold:
+            self._finish(request_id, text, conf, engine.name)
+            return
+        self.results.append((conf, text, engine.name))
+        self._check_done(request_id)
+
+    def _handle_error(self, engine, request_id, error):
+        if request_id != self.request_id or engine.name not in self.running:
+            return
+        self.running.remove(engine.name)
+        print('ocr race error', engine.name, error)
+        self._check_done(request_id)
+
+    def _check_done(self, request_id):
+        if self.running:
+            return
+        if not self.results:
+            self.request_id = None
+            self.error_occurred.emit(request_id, 'all ocr engines failed')
+            return
+        conf, text, winner = max(self.results, key=lambda result: result[0])
+        self._finish(request_id, text, conf, winner)
+
+    @Slot(str)
+    def _handle_state_changed(self, state):
+        self.state_changed.emit(self.state())
+
+
+class OcrEngineRegistry:
+    def __init__(self):
+        self.engines = OrderedDict()
+
+    def register(self, engine):
+        self.engines[engine.name] = engine
+
+    def get(self, name):
+        return self.engines.get(name)
+
+    def names(self):
+        return list(self.engines.keys())
+
+    def __iter__(self):
+        return iter(self.engines.values())
+
+
+class EngineStats:
+    def __init__(self, window=50, failure_window=120):
+        self.latencies = deque(maxlen=window)
+        self.results = deque(maxlen=window)
+        # (完成时间, True成功，False失败)
+        self.failure_window = failure_window
+        # 失败率只统计最近这么多秒的结果，失败率太高的引擎不再被选中，结果不会更新，旧的失败要自动过期
+        # 比如模型加载时的失败，过一段时间后引擎可以重新参与自动选择
+
+    def add(self, latency, ok):
+        if ok:
+            self.latencies.append(latency)
+        self.results.append((time.monotonic(), ok))
+
+    def p50(self, default):
+        return percentile(list(self.latencies), 50) if self.latencies else default
+
+    def p95(self, default):
+        return percentile(list(self.latencies), 95) if self.latencies else default
+
+    def failure_rate(self):
+        now = time.monotonic()
+        while self.results and now - self.results[0][0] > self.failure_window:
+            self.results.popleft()
+        if not self.results:
+            return 0.0
+        return sum(1 for t, ok in self.results if not ok) / len(self.results)
+
+
+class OcrRouter:
+    # 统计每个引擎最近的耗时和失败率，选择能识别这种文字的最快的可用引擎
+    max_failure_rate = 0.5
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.stats = {name: EngineStats() for name in registry.names()}
+        self.pending = {}
+        # request_id -> (引擎名, 开始时间)
+
+    def is_healthy(self, engine):
+        return engine.is_available() and self.stats[engine.name].failure_rate() <= self.max_failure_rate
+
+    def route(self, requested, script):
+        engine = self.registry.get(requested)
+        if engine is not None and engine.is_available():
+            return engine
+
+        candidates = [e for e in self.registry if e.routable and self.is_healthy(e) and e.supports(script)]
+        if not candidates:
+            candidates = [e for e in self.registry if e.routable and e.is_available()]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda e: self.stats[e.name].p50(e.expected_latency))
+
+    def begin(self, request_id, engine):
+        # 只统计最新的请求，旧的请求结果会被丢弃
+        self.pending = {request_id: (engine.name, time.perf_counter())}
+
+    def is_pending(self, request_id, name):
+        return request_id in self.pending and self.pending[request_id][0] == name
+
+    def finish(self, request_id, name, ok):
+        # 只有发出请求的引擎的结果才算数，比如race模式下两个子引擎各自的结果不算
+        if not self.is_pending(request_id, name):
+            return False
+        name, t1 = self.pending.pop(request_id)
+        self.stats[name].add((time.perf_counter() - t1) * 1000, ok)
+        return True
+
+    def summary(self, name):
+        engine = self.registry.get(name)
+        stats = self.stats[name]
+        return (f'p50 {stats.p50(engine.expected_latency):.0f}ms, p95 {stats.p95(engine.expected_latency):.0f}ms, '
+                f'failure {stats.failure_rate():.0%}')
@@ -0,0 +1,175 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import psutil
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+import ocr_worker
+
+
+class OcrExecutor(QObject):
+    # OCR在子进程中运行，结果通过信号返回GUI线程
+    result_ready = Signal(int, str, float)
+    error_occurred = Signal(int, str)
+    state_changed = Signal(str)
+    _future_done = Signal(int, object)
+    _ping_done = Signal(int, object)
+
+    def __init__(self, engine='manga-ocr', workers=1, max_length=300, threads=1, interop_threads=1, parent=None):
+        super().__init__(parent)
+
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.max_length = max_length
+        self.threads = threads
+        self.interop_threads = interop_threads
+        # 每个子进程的intra-op和inter-op线程数
+        self.pool = None
+        self.generation = 0
+        # 每次启动进程池加一，区分旧进程池的回调
+        self.state = 'unloaded'
+        # unloaded, loading, ready, failed
+
+        self.request_id = 0
+        self.pending = {}
+        self.worker_pids = set()
+        self.last_used = time.monotonic()
+
+        self._future_done.connect(self._handle_future_done)
+        self._ping_done.connect(self._handle_ping_done)
+
+    def start(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=ocr_worker.init_worker,
+                                            initargs=(self.engine, ocr_worker.model_path, self.max_length,
+                                                      self.threads, self.interop_threads))
+            self.generation += 1
+            self.set_state('loading')
+            self.last_used = time.monotonic()
+            # 进程池是按需启动子进程的，提交和进程数相同的任务让所有子进程立即开始加载模型
+            for i in range(self.workers):
+                self.pool.submit(ocr_worker.ping).add_done_callback(partial(self._ping_done.emit, self.generation))
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.cancel_pending()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+            self.worker_pids.clear()
+            self.set_state('unloaded')
+
+    def set_engine(self, engine):
+        # 切换引擎需要重启子进程
+        if self.engine != engine:
+            self.shutdown()
+            self.engine = engine
+            self.start()
+
+    def set_state(self, state):
+        if self.state != state:
+            self.state = state
+            self.state_changed.emit(state)
+
+    def is_ready(self):
+        return self.state == 'ready'
+
+    def submit(self, request_id, img):
+        # 后提交的请求优先，之前还在排队的请求全部取消
+        self.start()
+        self.cancel_pending()
+        self.request_id = request_id
+        self.last_used = time.monotonic()
+        try:
+            future = self.pool.submit(ocr_worker.run_ocr, request_id, img)
+        except BrokenProcessPool as e:
+            self.handle_broken(e)
+            self.error_occurred.emit(request_id, str(e))
+            return None
+        self.pending[request_id] = future
+        future.add_done_callback(partial(self._future_done.emit, self.generation))
+        return future
+
+    def handle_broken(self, e):
+        # 子进程崩溃或者内存不足被系统结束后，进程池不能再用
+        # 释放进程池，状态变成unloaded，路由改用其他引擎，下一次截屏查词时reload_ocr_model重新启动
+        print('ocr worker died', e)
+        self.shutdown()
+
+    def cancel(self, request_id):
+        future = self.pending.get(request_id)
+        if future is not None and future.cancel():
+            del self.pending[request_id]
+
+    def cancel_pending(self):
+        for request_id, future in list(self.pending.items()):
+            if future.cancel():
+                del self.pending[request_id]
+
+    def is_latest(self, request_id):
+        return request_id == self.request_id
+
+    def idle_time(self):
+        # 距离上一次提交识别的秒数，还有识别没有完成时为0
+        if self.pending:
+            return 0
+        return time.monotonic() - self.last_used
+
+    def memory_rss(self):
+        # 所有子进程的常驻内存，字节
+        total = 0
+        for pid in list(self.worker_pids):
+            try:
+                total += psutil.Process(pid).memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                self.worker_pids.discard(pid)
+        return total
+
+    @Slot(int, object)
+    def _handle_ping_done(self, generation, future):
+        # 任意一个子进程加载完成即可开始识别
+        if future.cancelled() or generation != self.generation:
+            return
+        try:
+            pid = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                loading = self.state == 'loading'
+                self.handle_broken(e)
+                if loading:
+                    # 加载模型时崩溃，不自动重试
+                    self.set_state('failed')
+            elif self.state == 'loading':
+                print('ocr model load error', e)
+                self.set_state('failed')
+            return
+        if self.pool is None:
+            # 加载完成之前已经释放
+            return
+        self.worker_pids.add(pid)
+        if self.state == 'loading':
+            self.set_state('ready')
+
+    @Slot(int, object)
+    def _handle_future_done(self, generation, future):
+        # add_done_callback在进程池的管理线程中调用，这里已经回到GUI线程
+        if future.cancelled():
+            return
+        try:
+            request_id, text, conf = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and generation == self.generation and self.pool is not None:
+                self.handle_broken(e)
+            for request_id, pending_future in list(self.pending.items()):
+                if pending_future is future:
+                    del self.pending[request_id]
+                    self.error_occurred.emit(request_id, str(e))
+            return
+
+        self.pending.pop(request_id, None)
+        if self.is_latest(request_id):
+            self.result_ready.emit(request_id, text, conf)
+        else:
+            print('drop stale ocr result', request_id)
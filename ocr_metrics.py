@@ -0,0 +1,57 @@
+import os
+
+from PIL import Image
+
+# 测试集目录中每张图片xxx.png对应一个标注文件xxx.txt，内容是图片中的文字
+
+image_exts = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def load_corpus(corpus_path):
+    corpus = []
+    for name in sorted(os.listdir(corpus_path)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in image_exts:
+            continue
+        label_file = os.path.join(corpus_path, stem + '.txt')
+        if not os.path.exists(label_file):
+            print('no label', name)
+            continue
+        with open(label_file, 'r', encoding='utf-8') as f:
+            label = f.read().strip()
+        img = Image.open(os.path.join(corpus_path, name))
+        img.load()
+        corpus.append((name, img, label))
+    return corpus
+
+
+def edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def char_error_rate(predictions, labels):
+    # 所有样本的编辑距离之和除以标注的字符总数
+    errors = 0
+    total = 0
+    for pred, label in zip(predictions, labels):
+        errors += edit_distance(pred, label)
+        total += len(label)
+    if total == 0:
+        return 0.0
+    return errors / total
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
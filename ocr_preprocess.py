@@ -0,0 +1,109 @@
+import numpy as np
+from PIL import Image
+
+# 截图送给OCR引擎之前的预处理，每张截图只处理一次，所有引擎共用处理后的图片
+# 可用的步骤：gray, invert, trim, binarize, upscale, pad，按配置的顺序执行
+# 只要配置了任意步骤，输出的都是灰度图；配置为空时不做处理
+
+default_steps = 'gray,invert,trim,upscale,pad'
+
+min_height = 40
+# 小于这个高度（竖排文字是宽度）的截图放大到这个尺寸
+max_scale = 4
+pad_size = 10
+trim_tolerance = 24
+# 和背景的灰度差小于这个值的像素算作背景
+binarize_window = 25
+binarize_offset = 10
+
+
+def parse_steps(steps):
+    return [step.strip() for step in steps.split(',') if step.strip() != '']
+
+
+def to_gray(a):
+    if a.ndim == 3:
+        return a[..., :3] @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return a
+
+
+def border_pixels(a):
+    return np.concatenate([a[0], a[-1], a[:, 0], a[:, -1]])
+
+
+def invert(a):
+    # 浅色文字深色背景时反色，统一成白底黑字
+    if np.median(border_pixels(a)) < 128:
+        return 255 - a
+    return a
+
+
+def trim(a):
+    background = np.median(border_pixels(a))
+    mask = np.abs(a - background) > trim_tolerance
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if len(rows) == 0 or len(cols) == 0:
+        return a
+    return a[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+
+def binarize(a):
+    # 局部均值阈值，用积分图计算每个像素周围binarize_window范围内的均值
+    h, w = a.shape
+    r = binarize_window // 2
+    integral = np.pad(a.astype(np.float64).cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    y = np.arange(h)
+    x = np.arange(w)
+    y1 = np.clip(y - r, 0, h)[:, None]
+    y2 = np.clip(y + r + 1, 0, h)[:, None]
+    x1 = np.clip(x - r, 0, w)[None, :]
+    x2 = np.clip(x + r + 1, 0, w)[None, :]
+    area = (y2 - y1) * (x2 - x1)
+    total = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    mean = total / area
+    return np.where(a < mean - binarize_offset, 0, 255).astype(np.float32)
+
+
+def upscale(a):
+    h, w = a.shape
+    short = min(h, w)
+    if short == 0 or short >= min_height:
+        return a
+    scale = min(max_scale, min_height / short)
+    img = Image.fromarray(a.clip(0, 255).astype(np.uint8), 'L')
+    img = img.resize((round(w * scale), round(h * scale)), Image.LANCZOS)
+    return np.asarray(img, dtype=np.float32)
+
+
+def pad(a):
+    background = np.median(border_pixels(a))
+    return np.pad(a, pad_size, mode='constant', constant_values=background)
+
+
+step_funcs = {
+    'invert': invert,
+    'trim': trim,
+    'binarize': binarize,
+    'upscale': upscale,
+    'pad': pad,
+}
+
+
+def preprocess(img, steps=default_steps):
+    steps = parse_steps(steps)
+    if not steps:
+        return img
+    a = np.asarray(img.convert('RGB'), dtype=np.float32)
+    # 后面的步骤都在灰度图上处理
+    a = to_gray(a)
+    for step in steps:
+        if step == 'gray':
+            continue
+        if step not in step_funcs:
+            print('unknown preprocess step', step)
+            continue
+        if a.size == 0:
+            break
+        a = step_funcs[step](a)
+    return Image.fromarray(a.clip(0, 255).astype(np.uint8), 'L')
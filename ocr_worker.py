@@ -0,0 +1,56 @@
+import os
+
+# 此模块在OCR子进程中运行，不要导入Qt相关的模块
+
+root_path = os.path.dirname(os.path.abspath(__file__))
+model_path = os.path.join(root_path, 'data', 'manga-ocr-base')
+
+mocr = None
+
+
+def init_worker(engine, path, max_length, threads=1, interop_threads=1):
+    # 每个子进程启动时加载一次模型，之后一直驻留在子进程中
+    global mocr
+    import thread_budget
+    thread_budget.set_omp_threads(threads)
+    if engine == 'manga-ocr':
+        thread_budget.set_torch_threads(threads, interop_threads)
+        from manga_ocr_engine import MangaOcrEngine
+        mocr = MangaOcrEngine(pretrained_model_name_or_path=path)
+    elif engine == 'manga-ocr-onnx':
+        from onnx_ocr import OnnxMangaOcr
+        mocr = OnnxMangaOcr(pretrained_model_name_or_path=path, max_length=max_length, threads=threads,
+                            interop_threads=interop_threads)
+    elif engine == 'manga-ocr-bf16':
+        thread_budget.set_torch_threads(threads, interop_threads)
+        from bf16_ocr import Bf16MangaOcr
+        mocr = Bf16MangaOcr(pretrained_model_name_or_path=path)
+    elif engine == 'manga-ocr-int8':
+        thread_budget.set_torch_threads(threads, interop_threads)
+        from quant_ocr import QuantizedMangaOcr
+        mocr = QuantizedMangaOcr(pretrained_model_name_or_path=path)
+    else:
+        raise Exception(f'unknown ocr engine {engine}')
+    # 超过查词长度上限的文字没有用，解码到这个长度就停止
+    mocr.max_length = max_length
+    warm_up()
+
+
+def warm_up():
+    # 用空白图片跑一次推理，避免第一次截屏查词时才分配内存
+    from PIL import Image
+    mocr(Image.new('RGB', (224, 224), 'white'))
+
+
+def ping():
+    # 返回子进程的pid，GUI进程用来统计模型占用的内存
+    return os.getpid()
+
+
+def run_ocr(request_id, img):
+    text, conf = mocr.recognize_scored(img)
+    return request_id, text, conf
+
+
+def run_ocr_batch(request_id, images):
+    return request_id, mocr.recognize_batch(images)
@@ -0,0 +1,238 @@
+import os
+import re
+import math
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import jaconv
+import onnxruntime
+from PIL import Image
+
+from ocr_decode import is_repeating, repeat_window
+
+# manga-ocr模型的onnxruntime版本，推理时不需要导入torch
+# 第一次使用时从data/manga-ocr-base导出onnx模型，保存在data/manga-ocr-onnx
+
+root_path = os.path.dirname(os.path.abspath(__file__))
+onnx_path = os.path.join(root_path, 'data', 'manga-ocr-onnx')
+
+encoder_name = 'encoder.onnx'
+decoder_name = 'decoder.onnx'
+
+
+def post_process(text):
+    # 和manga_ocr.ocr.post_process相同，manga_ocr.ocr会导入torch，所以这里复制一份
+    text = ''.join(text.split())
+    text = text.replace('…', '...')
+    text = re.sub('[・.]{2,}', lambda x: (x.end() - x.start()) * '.', text)
+    text = jaconv.h2z(text, ascii=True, digit=True)
+    return text
+
+
+def is_exported(out_path=onnx_path):
+    return (os.path.exists(os.path.join(out_path, encoder_name))
+            and os.path.exists(os.path.join(out_path, decoder_name)))
+
+
+def export_onnx(model_path, out_path=onnx_path):
+    # 只在导出时需要torch和transformers
+    import torch
+    from transformers import VisionEncoderDecoderModel
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.encoder = model.encoder
+            self.enc_to_dec_proj = getattr(model, 'enc_to_dec_proj', None)
+
+        def forward(self, pixel_values):
+            hidden = self.encoder(pixel_values=pixel_values).last_hidden_state
+            if self.enc_to_dec_proj is not None:
+                hidden = self.enc_to_dec_proj(hidden)
+            return hidden
+
+    class Decoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.decoder = model.decoder
+
+        def forward(self, input_ids, encoder_hidden_states):
+            return self.decoder(input_ids=input_ids, encoder_hidden_states=encoder_hidden_states).logits
+
+    model = VisionEncoderDecoderModel.from_pretrained(model_path)
+    model.eval()
+    os.makedirs(out_path, exist_ok=True)
+
+    pixel_values = torch.zeros(1, 3, 224, 224)
+    with torch.no_grad():
+        encoder = Encoder(model)
+        hidden = encoder(pixel_values)
+        input_ids = torch.tensor([[model.config.decoder_start_token_id]], dtype=torch.long)
+
+        # 先导出到临时文件再重命名，多个子进程同时导出时不会读到不完整的文件
+        tmp_path = os.path.join(out_path, f'{encoder_name}.{os.getpid()}.tmp')
+        torch.onnx.export(encoder, (pixel_values,), tmp_path, input_names=['pixel_values'],
+                          output_names=['encoder_hidden_states'],
+                          dynamic_axes={'pixel_values': {0: 'batch'}, 'encoder_hidden_states': {0: 'batch'}},
+                          opset_version=14)
+        os.replace(tmp_path, os.path.join(out_path, encoder_name))
+
+        tmp_path = os.path.join(out_path, f'{decoder_name}.{os.getpid()}.tmp')
+        torch.onnx.export(Decoder(model), (input_ids, hidden), tmp_path,
+                          input_names=['input_ids', 'encoder_hidden_states'], output_names=['logits'],
+                          dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                                        'encoder_hidden_states': {0: 'batch'},
+                                        'logits': {0: 'batch', 1: 'sequence'}},
+                          opset_version=14)
+        os.replace(tmp_path, os.path.join(out_path, decoder_name))
+
+
+class OnnxMangaOcr:
+    def __init__(self, pretrained_model_name_or_path, max_length=300, cache_size=8, threads=0, interop_threads=1):
+        model_path = pretrained_model_name_or_path
+        if not is_exported():
+            print('export manga-ocr to onnx...')
+            export_onnx(model_path)
+
+        with open(os.path.join(model_path, 'config.json'), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        with open(os.path.join(model_path, 'preprocessor_config.json'), 'r', encoding='utf-8') as f:
+            preprocessor_config = json.load(f)
+        with open(os.path.join(model_path, 'vocab.txt'), 'r', encoding='utf-8') as f:
+            self.vocab = [line.rstrip('\n') for line in f]
+
+        self.decoder_start_token_id = config['decoder_start_token_id']
+        self.eos_token_id = config['eos_token_id']
+        self.special_tokens = {'[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'}
+        self.max_length = max_length
+
+        self.image_size = preprocessor_config['size']
+        self.image_mean = np.array(preprocessor_config['image_mean'], dtype=np.float32).reshape(3, 1, 1)
+        self.image_std = np.array(preprocessor_config['image_std'], dtype=np.float32).reshape(3, 1, 1)
+        self.resample = preprocessor_config['resample']
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0表示由onnxruntime决定，默认使用所有物理核
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = interop_threads
+        if interop_threads > 1:
+            # inter-op线程只在并行执行模式下使用
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        providers = ['CPUExecutionProvider']
+        self.encoder = onnxruntime.InferenceSession(os.path.join(onnx_path, encoder_name), options,
+                                                    providers=providers)
+        self.decoder = onnxruntime.InferenceSession(os.path.join(onnx_path, decoder_name), options,
+                                                    providers=providers)
+
+        # 同一张图片重复识别时跳过encoder
+        self.cache_size = cache_size
+        self.encoder_cache = OrderedDict()
+
+    def __call__(self, img):
+        return self.recognize_scored(img)[0]
+
+    def recognize_scored(self, img):
+        # 返回(文字, 置信度)，置信度是每个token概率的几何平均，0到1
+        img = img.convert('L').convert('RGB')
+        pixel_values = self._preprocess(img)
+        hidden = self._encode(pixel_values)
+        token_ids, score = self._greedy_decode(hidden)
+        if token_ids is None:
+            return '', 0.0
+        return post_process(self._decode_tokens(token_ids)), math.exp(score)
+
+    def recognize_batch(self, images, max_batch_size=8):
+        texts = []
+        for i in range(0, len(images), max_batch_size):
+            batch = [img.convert('L').convert('RGB') for img in images[i:i + max_batch_size]]
+            pixel_values = np.concatenate([self._preprocess(img) for img in batch])
+            hidden = self.encoder.run(None, {'pixel_values': pixel_values})[0]
+            for token_ids in self._greedy_decode_batch(hidden):
+                if token_ids is None:
+                    texts.append('')
+                else:
+                    texts.append(post_process(self._decode_tokens(token_ids)))
+        return texts
+
+    def _preprocess(self, img):
+        img = img.resize((self.image_size, self.image_size), resample=self.resample)
+        x = np.asarray(img, dtype=np.float32).transpose(2, 0, 1) / 255
+        x = (x - self.image_mean) / self.image_std
+        return x[None]
+
+    def _encode(self, pixel_values):
+        key = hashlib.sha1(pixel_values.tobytes()).digest()
+        if key in self.encoder_cache:
+            self.encoder_cache.move_to_end(key)
+            return self.encoder_cache[key]
+
+        hidden = self.encoder.run(None, {'pixel_values': pixel_values})[0]
+        self.encoder_cache[key] = hidden
+        if len(self.encoder_cache) > self.cache_size:
+            self.encoder_cache.popitem(last=False)
+        return hidden
+
+    def _greedy_decode(self, hidden):
+        # encoder只运行一次，每一步解码都复用encoder的输出
+        # torch引擎按config.json顶层的num_beams=4做beam search，encoder和decoder子配置中的num_beams=1不起作用
+        # 这里是贪心解码，和torch引擎比较速度时，一部分差距来自beam的数量，不全是onnxruntime的作用
+        # 返回(token_ids, 平均对数概率)，超过max_length或者陷入重复循环时token_ids为None
+        token_ids = [self.decoder_start_token_id]
+        window = repeat_window()
+        log_prob = 0.0
+        for i in range(self.max_length + 1):
+            input_ids = np.array([token_ids], dtype=np.int64)
+            logits = self.decoder.run(None, {'input_ids': input_ids, 'encoder_hidden_states': hidden})[0]
+            step = logits[0, -1].astype(np.float64)
+            token_id = int(step.argmax())
+            # 贪心解码选中的是最大的logit，它的log softmax是-log(sum(exp(logits - max)))
+            log_prob -= np.log(np.exp(step - step[token_id]).sum())
+            if token_id == self.eos_token_id:
+                return token_ids[1:], log_prob / len(token_ids)
+            token_ids.append(token_id)
+            if is_repeating(token_ids[-window:]):
+                return None, 0.0
+        return None, 0.0
+
+    def _greedy_decode_batch(self, hidden):
+        # 所有序列一起解码，已经结束的序列后面补eos，全部结束后停止
+        batch_size = hidden.shape[0]
+        input_ids = np.full((batch_size, 1), self.decoder_start_token_id, dtype=np.int64)
+        finished = np.zeros(batch_size, dtype=bool)
+        failed = np.zeros(batch_size, dtype=bool)
+        window = repeat_window()
+        for i in range(self.max_length + 1):
+            logits = self.decoder.run(None, {'input_ids': input_ids, 'encoder_hidden_states': hidden})[0]
+            next_ids = logits[:, -1].argmax(axis=-1)
+            next_ids = np.where(finished, self.eos_token_id, next_ids)
+            input_ids = np.concatenate([input_ids, next_ids[:, None]], axis=1)
+            finished |= next_ids == self.eos_token_id
+            for row in np.flatnonzero(~finished):
+                if is_repeating(input_ids[row, -window:].tolist()):
+                    finished[row] = True
+                    failed[row] = True
+            if finished.all():
+                break
+
+        results = []
+        for row, row_ids in enumerate(input_ids[:, 1:]):
+            token_ids = []
+            ended = False
+            for token_id in row_ids:
+                if token_id == self.eos_token_id:
+                    ended = True
+                    break
+                token_ids.append(int(token_id))
+            results.append(token_ids if ended and not failed[row] else None)
+        return results
+
+    def _decode_tokens(self, token_ids):
+        tokens = []
+        for token_id in token_ids:
+            token = self.vocab[token_id]
+            if token not in self.special_tokens:
+                tokens.append(token.replace('##', ''))
+        return ''.join(tokens)
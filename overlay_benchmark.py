@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+from PIL import Image, ImageDraw
+from PySide6 import QtCore, QtGui
+from PySide6.QtWidgets import QApplication
+
+from ocr_metrics import percentile
+import screen_show
+
+# 截图窗口拖动选框的压力测试，模拟一次从左上到右下的拖动，统计每一帧的耗时
+# 不需要显示器时用offscreen平台运行
+# QT_QPA_PLATFORM=offscreen python overlay_benchmark.py --size 3840x2160 --steps 200
+# --full 每次移动都重绘整个窗口，用来和只重绘选框范围比较
+
+
+class DummyApp:
+    def grab_search_word(self, cap):
+        pass
+
+
+def make_screenshot(width, height):
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    for y in range(0, height, 40):
+        draw.text((20, y + 10), 'overlay benchmark ' * (width // 120), fill='black')
+    return img
+
+
+def replay_drag(window, steps, full):
+    paint_times = []
+    paint_event = window.paintEvent
+
+    def timed_paint(event):
+        t1 = time.perf_counter()
+        paint_event(event)
+        paint_times.append((time.perf_counter() - t1) * 1000)
+    window.paintEvent = timed_paint
+
+    width = window.width()
+    height = window.height()
+    start = QtCore.QPointF(width * 0.1, height * 0.1)
+
+    def send(event_type, pos, button, buttons):
+        event = QtGui.QMouseEvent(event_type, pos, window.mapToGlobal(pos), button, buttons,
+                                  QtCore.Qt.NoModifier)
+        QApplication.sendEvent(window, event)
+
+    send(QtCore.QEvent.MouseButtonPress, start, QtCore.Qt.LeftButton, QtCore.Qt.LeftButton)
+    QApplication.processEvents()
+    paint_times.clear()
+
+    frame_times = []
+    for i in range(1, steps + 1):
+        pos = QtCore.QPointF(start.x() + width * 0.8 * i / steps, start.y() + height * 0.8 * i / steps)
+        t1 = time.perf_counter()
+        send(QtCore.QEvent.MouseMove, pos, QtCore.Qt.NoButton, QtCore.Qt.LeftButton)
+        if full:
+            window.update()
+        QApplication.processEvents()
+        frame_times.append((time.perf_counter() - t1) * 1000)
+    return frame_times, paint_times
+
+
+def main():
+    parser = ArgumentParser(description='screenshot overlay drag benchmark')
+    parser.add_argument('--size', type=str, default='3840x2160', help='screenshot size in pixels')
+    parser.add_argument('--scale', type=float, default=1, help='device pixel ratio of the screenshot')
+    parser.add_argument('--steps', type=int, default=200, help='mouse move events in the drag')
+    parser.add_argument('--full', action='store_true', help='repaint the whole window on every move')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    width, height = [int(v) for v in args.size.lower().split('x')]
+    img = make_screenshot(width, height)
+
+    t1 = time.perf_counter()
+    window = screen_show.Ui_MainWindow(DummyApp())
+    window.set_frame(img, 0, 0, round(width / args.scale), round(height / args.scale), args.scale)
+    # offscreen平台的屏幕比较小，不用全屏，直接设置成截图的大小
+    window.showNormal()
+    window.setGeometry(0, 0, window.sw, round(height / args.scale))
+    QApplication.processEvents()
+    print(f'open {(time.perf_counter() - t1) * 1000:.1f}ms')
+
+    frame_times, paint_times = replay_drag(window, args.steps, args.full)
+    window.hide()
+    print(f'{img.width}x{img.height} scale {args.scale}, {args.steps} moves, {len(paint_times)} paints')
+    print(f'frame p50 {percentile(frame_times, 50):.2f}ms, p95 {percentile(frame_times, 95):.2f}ms, '
+          f'max {max(frame_times):.2f}ms')
+    if paint_times:
+        print(f'paint p50 {percentile(paint_times, 50):.2f}ms, p95 {percentile(paint_times, 95):.2f}ms, '
+              f'max {max(paint_times):.2f}ms')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
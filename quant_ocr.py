@@ -0,0 +1,50 @@
+import os
+
+import torch
+from transformers import ViTImageProcessor, AutoTokenizer
+from manga_ocr import MangaOcr
+
+from manga_ocr_engine import MangaOcrEngine
+
+# manga-ocr的int8动态量化版本，encoder和decoder中的Linear层量化为int8，只能在CPU上运行
+# 第一次使用时从fp32模型量化，保存在data/manga-ocr-int8，之后直接加载量化后的模型
+
+root_path = os.path.dirname(os.path.abspath(__file__))
+quant_path = os.path.join(root_path, 'data', 'manga-ocr-int8')
+
+
+def get_quant_file():
+    # 序列化的量化模型和torch版本相关，torch升级后重新量化
+    return os.path.join(quant_path, f'model-torch{torch.__version__}.pt')
+
+
+def quantize_model(model):
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def build_quantized_model(model_path):
+    mocr = MangaOcr(pretrained_model_name_or_path=model_path, force_cpu=True)
+    model = quantize_model(mocr.model)
+    os.makedirs(quant_path, exist_ok=True)
+    quant_file = get_quant_file()
+    tmp_file = f'{quant_file}.{os.getpid()}.tmp'
+    torch.save(model, tmp_file)
+    os.replace(tmp_file, quant_file)
+    return model
+
+
+class QuantizedMangaOcr(MangaOcrEngine):
+    def __init__(self, pretrained_model_name_or_path):
+        # 不调用MangaOcr.__init__，避免每次都先加载一遍fp32模型
+        path = pretrained_model_name_or_path
+        self.processor = ViTImageProcessor.from_pretrained(path)
+        self.tokenizer = AutoTokenizer.from_pretrained(path, tokenizer_type='bert-japanese')
+
+        quant_file = get_quant_file()
+        if os.path.exists(quant_file):
+            self.model = torch.load(quant_file, weights_only=False)
+        else:
+            print('quantize manga-ocr to int8...')
+            self.model = build_quantized_model(path)
+        self.model.eval()
@@ -0,0 +1,80 @@
+import os
+import time
+import gc
+from argparse import ArgumentParser
+
+import psutil
+
+from ocr_metrics import load_corpus, char_error_rate, percentile
+import ocr_worker
+
+# 比较fp32和int8量化模型的字符错误率、单张图片耗时和内存占用
+# python quant_report.py path/to/corpus
+
+
+def load_model(name):
+    if name == 'fp32':
+        from manga_ocr import MangaOcr
+        return MangaOcr(pretrained_model_name_or_path=ocr_worker.model_path, force_cpu=True)
+    else:
+        from quant_ocr import QuantizedMangaOcr
+        return QuantizedMangaOcr(pretrained_model_name_or_path=ocr_worker.model_path)
+
+
+def run_model(name, corpus):
+    process = psutil.Process(os.getpid())
+    gc.collect()
+    rss_before = process.memory_info().rss
+    mocr = load_model(name)
+    rss_model = process.memory_info().rss - rss_before
+
+    predictions = []
+    latencies = []
+    for img_name, img, label in corpus:
+        t1 = time.perf_counter()
+        predictions.append(mocr(img))
+        latencies.append((time.perf_counter() - t1) * 1000)
+
+    del mocr
+    gc.collect()
+    return predictions, latencies, rss_model
+
+
+def main():
+    parser = ArgumentParser(description='manga-ocr int8 quantization report')
+    parser.add_argument('corpus', type=str, help='directory of images with .txt labels')
+    parser.add_argument('--verbose', action='store_true', help='print every differing prediction')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print('empty corpus')
+        return
+    labels = [label for img_name, img, label in corpus]
+
+    results = {}
+    for name in ['fp32', 'int8']:
+        results[name] = run_model(name, corpus)
+
+    print(f'{len(corpus)} images')
+    print(f'{"model":<8}{"CER":>8}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"model MB":>10}')
+    for name, (predictions, latencies, rss_model) in results.items():
+        cer = char_error_rate(predictions, labels)
+        mean = sum(latencies) / len(latencies)
+        print(f'{name:<8}{cer:>8.4f}{mean:>10.1f}{percentile(latencies, 50):>10.1f}'
+              f'{percentile(latencies, 95):>10.1f}{rss_model / 1024 / 1024:>10.1f}')
+
+    fp32_predictions = results['fp32'][0]
+    int8_predictions = results['int8'][0]
+    diff = 0
+    for (img_name, img, label), p1, p2 in zip(corpus, fp32_predictions, int8_predictions):
+        if p1 != p2:
+            diff += 1
+            if args.verbose:
+                print(f'{img_name}: label={label} fp32={p1} int8={p2}')
+    print(f'int8 differs from fp32 on {diff}/{len(corpus)} images, '
+          f'CER against fp32 {char_error_rate(int8_predictions, fp32_predictions):.4f}')
+
+
+if __name__ == '__main__':
+    main()
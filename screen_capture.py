@@ -0,0 +1,268 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+from ctypes import c_int, c_uint, c_ulong, c_char_p, c_void_p, POINTER, Structure
+
+from PIL import Image, ImageGrab
+
+# 截屏后端，只截取一个屏幕或者一个矩形，截图的时间和内存只和截取的范围有关
+# 坐标是虚拟桌面的物理像素坐标，主屏幕的左上角是原点
+# win32: GDI BitBlt，只复制需要的范围
+# xshm: X11的MIT-SHM扩展，截图直接写入共享内存，可以在Xvfb下测试
+# pil: PIL.ImageGrab，会先截取整个桌面再裁剪，其他后端不可用时使用
+# python screen_capture.py --backend xshm --rect 0,0,800,600  测试截图速度，比如xvfb-run python screen_capture.py
+
+
+class PilCapture:
+    name = 'pil'
+
+    def grab(self, left, top, width, height):
+        return ImageGrab.grab(bbox=(left, top, left + width, top + height), all_screens=True)
+
+    def close(self):
+        pass
+
+
+class Win32Capture:
+    name = 'win32'
+
+    def __init__(self):
+        import win32con
+        import win32gui
+        import win32ui
+        self.win32con = win32con
+        self.win32gui = win32gui
+        self.win32ui = win32ui
+
+    def grab(self, left, top, width, height):
+        hwnd = self.win32gui.GetDesktopWindow()
+        hdc = self.win32gui.GetWindowDC(hwnd)
+        src_dc = self.win32ui.CreateDCFromHandle(hdc)
+        mem_dc = src_dc.CreateCompatibleDC()
+        bitmap = self.win32ui.CreateBitmap()
+        try:
+            bitmap.CreateCompatibleBitmap(src_dc, width, height)
+            mem_dc.SelectObject(bitmap)
+            mem_dc.BitBlt((0, 0), (width, height), src_dc, (left, top), self.win32con.SRCCOPY)
+            data = bitmap.GetBitmapBits(True)
+        finally:
+            self.win32gui.DeleteObject(bitmap.GetHandle())
+            mem_dc.DeleteDC()
+            src_dc.DeleteDC()
+            self.win32gui.ReleaseDC(hwnd, hdc)
+        return Image.frombuffer('RGB', (width, height), data, 'raw', 'BGRX', 0, 1)
+
+    def close(self):
+        pass
+
+
+class XImage(Structure):
+    # 只用到前面的字段，后面的函数指针不需要
+    _fields_ = [
+        ('width', c_int),
+        ('height', c_int),
+        ('xoffset', c_int),
+        ('format', c_int),
+        ('data', c_void_p),
+        ('byte_order', c_int),
+        ('bitmap_unit', c_int),
+        ('bitmap_bit_order', c_int),
+        ('bitmap_pad', c_int),
+        ('depth', c_int),
+        ('bytes_per_line', c_int),
+        ('bits_per_pixel', c_int),
+        ('red_mask', c_ulong),
+        ('green_mask', c_ulong),
+        ('blue_mask', c_ulong),
+    ]
+
+
+class XShmSegmentInfo(Structure):
+    _fields_ = [
+        ('shmseg', c_ulong),
+        ('shmid', c_int),
+        ('shmaddr', c_void_p),
+        ('readOnly', c_int),
+    ]
+
+
+z_pixmap = 2
+all_planes = 0xffffffffffffffff if ctypes.sizeof(c_ulong) == 8 else 0xffffffff
+ipc_private = 0
+ipc_creat = 0o1000
+ipc_rmid = 0
+
+
+class XShmCapture:
+    name = 'xshm'
+
+    def __init__(self, display_name=None):
+        x11_path = ctypes.util.find_library('X11')
+        xext_path = ctypes.util.find_library('Xext')
+        if x11_path is None or xext_path is None:
+            raise OSError('libX11 or libXext not found')
+        self.x11 = ctypes.CDLL(x11_path)
+        self.xext = ctypes.CDLL(xext_path)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        self.x11.XOpenDisplay.restype = c_void_p
+        self.x11.XOpenDisplay.argtypes = [c_char_p]
+        self.x11.XDefaultScreen.argtypes = [c_void_p]
+        self.x11.XRootWindow.restype = c_ulong
+        self.x11.XRootWindow.argtypes = [c_void_p, c_int]
+        self.x11.XDefaultVisual.restype = c_void_p
+        self.x11.XDefaultVisual.argtypes = [c_void_p, c_int]
+        self.x11.XDefaultDepth.argtypes = [c_void_p, c_int]
+        self.x11.XSync.argtypes = [c_void_p, c_int]
+        self.x11.XFree.argtypes = [c_void_p]
+        self.x11.XCloseDisplay.argtypes = [c_void_p]
+        self.xext.XShmQueryExtension.argtypes = [c_void_p]
+        self.xext.XShmCreateImage.restype = POINTER(XImage)
+        self.xext.XShmCreateImage.argtypes = [c_void_p, c_void_p, c_uint, c_int, c_void_p,
+                                              POINTER(XShmSegmentInfo), c_uint, c_uint]
+        self.xext.XShmAttach.argtypes = [c_void_p, POINTER(XShmSegmentInfo)]
+        self.xext.XShmDetach.argtypes = [c_void_p, POINTER(XShmSegmentInfo)]
+        self.xext.XShmGetImage.argtypes = [c_void_p, c_ulong, POINTER(XImage), c_int, c_int, c_ulong]
+        self.libc.shmget.argtypes = [c_int, ctypes.c_size_t, c_int]
+        self.libc.shmat.restype = c_void_p
+        self.libc.shmat.argtypes = [c_int, c_void_p, c_int]
+        self.libc.shmdt.argtypes = [c_void_p]
+        self.libc.shmctl.argtypes = [c_int, c_int, c_void_p]
+
+        name = display_name.encode('utf-8') if display_name else None
+        self.display = self.x11.XOpenDisplay(name)
+        if not self.display:
+            raise OSError('cannot open X display')
+        if not self.xext.XShmQueryExtension(self.display):
+            self.x11.XCloseDisplay(self.display)
+            raise OSError('MIT-SHM extension not available')
+        screen = self.x11.XDefaultScreen(self.display)
+        self.root = self.x11.XRootWindow(self.display, screen)
+        self.visual = self.x11.XDefaultVisual(self.display, screen)
+        self.depth = self.x11.XDefaultDepth(self.display, screen)
+
+        self.image = None
+        self.shminfo = None
+        # 同样大小的截图复用共享内存
+
+    def create_image(self, width, height):
+        self.destroy_image()
+        shminfo = XShmSegmentInfo()
+        image = self.xext.XShmCreateImage(self.display, self.visual, self.depth, z_pixmap, None,
+                                          ctypes.byref(shminfo), width, height)
+        if not image:
+            raise OSError('XShmCreateImage failed')
+        size = image.contents.bytes_per_line * height
+        shminfo.shmid = self.libc.shmget(ipc_private, size, ipc_creat | 0o600)
+        if shminfo.shmid < 0:
+            self.x11.XFree(image)
+            raise OSError(ctypes.get_errno(), 'shmget failed')
+        shminfo.shmaddr = self.libc.shmat(shminfo.shmid, None, 0)
+        # 标记删除，最后一个进程detach后释放，程序异常退出也不会残留
+        self.libc.shmctl(shminfo.shmid, ipc_rmid, None)
+        if shminfo.shmaddr in (None, ctypes.c_void_p(-1).value):
+            self.x11.XFree(image)
+            raise OSError(ctypes.get_errno(), 'shmat failed')
+        shminfo.readOnly = 0
+        image.contents.data = shminfo.shmaddr
+        self.xext.XShmAttach(self.display, ctypes.byref(shminfo))
+        self.x11.XSync(self.display, 0)
+        self.image = image
+        self.shminfo = shminfo
+
+    def destroy_image(self):
+        if self.image is None:
+            return
+        self.xext.XShmDetach(self.display, ctypes.byref(self.shminfo))
+        self.x11.XSync(self.display, 0)
+        # data是共享内存，不能由XDestroyImage释放
+        self.image.contents.data = None
+        self.x11.XFree(self.image)
+        self.libc.shmdt(self.shminfo.shmaddr)
+        self.image = None
+        self.shminfo = None
+
+    def grab(self, left, top, width, height):
+        if self.image is None or self.image.contents.width != width or self.image.contents.height != height:
+            self.create_image(width, height)
+        if not self.xext.XShmGetImage(self.display, self.root, self.image, left, top, all_planes):
+            raise OSError('XShmGetImage failed')
+        image = self.image.contents
+        if image.bits_per_pixel != 32:
+            raise OSError(f'unsupported bits per pixel {image.bits_per_pixel}')
+        data = ctypes.string_at(image.data, image.bytes_per_line * height)
+        return Image.frombuffer('RGB', (width, height), data, 'raw', 'BGRX', image.bytes_per_line, 1)
+
+    def close(self):
+        if self.display:
+            self.destroy_image()
+            self.x11.XCloseDisplay(self.display)
+            self.display = None
+
+
+capture_backends = {
+    'win32': Win32Capture,
+    'xshm': XShmCapture,
+    'pil': PilCapture,
+}
+
+
+def wait_for_compositor():
+    # 窗口隐藏后，要等窗口管理器合成下一帧，屏幕上才没有这个窗口
+    # win32: DwmFlush阻塞到下一次合成完成；其他平台没有合成器时隐藏是同步的
+    if sys.platform == 'win32':
+        try:
+            ctypes.windll.dwmapi.DwmFlush()
+        except (AttributeError, OSError) as e:
+            print('DwmFlush error', e)
+
+
+def create_capture(backend='auto'):
+    if backend == 'auto':
+        if sys.platform == 'win32':
+            backend = 'win32'
+        elif os.environ.get('DISPLAY'):
+            backend = 'xshm'
+        else:
+            backend = 'pil'
+    if backend not in capture_backends:
+        print('unknown capture backend', backend)
+        backend = 'pil'
+    try:
+        return capture_backends[backend]()
+    except (OSError, ImportError) as e:
+        # 缺少依赖或者不是对应的平台时退回到PIL
+        print(f'capture backend {backend} error, use pil', e)
+        return PilCapture()
+
+
+def main():
+    from argparse import ArgumentParser
+    import psutil
+
+    parser = ArgumentParser(description='screen capture backend test')
+    parser.add_argument('--backend', type=str, default='auto', help='auto, win32, xshm or pil')
+    parser.add_argument('--rect', type=str, default='0,0,640,480', help='left,top,width,height')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--save', type=str, default='', help='save the last capture to this file')
+    args = parser.parse_args()
+
+    left, top, width, height = [int(v) for v in args.rect.split(',')]
+    capture = create_capture(args.backend)
+    process = psutil.Process(os.getpid())
+    times = []
+    for i in range(args.repeat):
+        t1 = time.perf_counter()
+        img = capture.grab(left, top, width, height)
+        times.append((time.perf_counter() - t1) * 1000)
+    capture.close()
+    print(f'{capture.name}: {img.size}, first {times[0]:.1f}ms, min {min(times):.1f}ms, '
+          f'mean {sum(times) / len(times):.1f}ms, rss {process.memory_info().rss / 1024 / 1024:.1f}MB')
+    if args.save != '':
+        img.save(args.save)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,65 +13,109 @@ from PySide6.QtGui import QCursor, QPixmap, QScreen,QShortcut,QKeySequence,Qt
 import sys
 import os
 import datetime
+from functools import partial
 from PIL import ImageGrab, ImageQt
 
+from click_detect import crop_click_word
+from screen_capture import wait_for_compositor
+
 
 # 因为此ui要作为子窗口被调用，所以要修改继承的类
 class Ui_MainWindow(QtWidgets.QMainWindow):
 
-    def __init__(self, app, img, sx, sy, sw, sh, sc):
+    def __init__(self, app):
         super(Ui_MainWindow, self).__init__()
         self.setupUi(self)
 
         self.app = app
-        self.sx = sx
-        self.sy = sy
-        self.sw = sw
-        self.sy = sh
-        self.img = img
-        self.scale = sc
+        self.sx = 0
+        self.sy = 0
+        self.sw = 0
+        self.sh = 0
+        self.img = None
+        self.scale = 1
+        # 截图只转换一次，拖动选框时重复使用
+        self.pixmap = QPixmap()
 
         self.cap = None
+        self.fresh = False
+        # 显示的是后台截取的预览帧时，松开鼠标后重新截取选中的范围
+        self.fresh_rect = None
 
         pixmap = QPixmap('data/imgs/mouse.png')
         cursor = QCursor(pixmap)
         self.setCursor(cursor)
 
-        self.setGeometry(sx, sy, sw, sh)
-
         # 创建QPoint类型的数据，因为pyqt监听鼠标事件返回的坐标点是Qpoint类型
         self.firstPoint = QtCore.QPoint()
         self.endPoint = QtCore.QPoint()
+        self.last_rect = QtCore.QRect()
+        # 上一次画出的选框，移动鼠标时只重绘新旧选框覆盖的范围
 
         self.setWindowFlags(QtCore.Qt.WindowType.WindowStaysOnTopHint)  # 让窗口显示在屏幕的最上层
         self.setWindowState(QtCore.Qt.WindowFullScreen)  # 窗口全屏幕
 
         # 设置画图事件
 
+    def set_screen(self, screen):
+        # 窗口预先放到对应的屏幕上，截屏时不需要再移动
+        self.setScreen(screen)
+        self.setGeometry(screen.geometry())
+
+    def set_frame(self, img, sx, sy, sw, sh, sc, fresh=False):
+        self.sx = sx
+        self.sy = sy
+        self.sw = sw
+        self.sh = sh
+        self.img = img
+        self.scale = sc
+        self.pixmap = QPixmap.fromImage(ImageQt.toqimage(img))
+        self.pixmap.setDevicePixelRatio(sc)
+        self.cap = None
+        self.fresh = fresh
+        self.fresh_rect = None
+        self.firstPoint = QtCore.QPoint()
+        self.endPoint = QtCore.QPoint()
+        self.last_rect = QtCore.QRect()
+        if self.geometry() != QtCore.QRect(sx, sy, sw, sh):
+            self.setGeometry(sx, sy, sw, sh)
+
     def paintEvent(self, a0: QtGui.QPaintEvent) -> None:
         # QPainter是在窗体中用来绘制的类
         paint = QtGui.QPainter(self)
-        # 把图片绘制到窗体中，前两个0表示图片相对窗体左上角的位置，这里设置0，0为了让窗体全屏幕显示
+        # 只绘制需要重绘的部分，源范围是截图的物理像素
         # paint.drawPixmap(0, 0, QtGui.QPixmap('./屏幕快照.png'))
-        cap = QtGui.QPixmap(ImageQt.toqimage(self.img))
-        cap.setDevicePixelRatio(self.scale)
-        paint.drawPixmap(0, 0, cap)
+        rect = QtCore.QRectF(a0.rect())
+        source = QtCore.QRectF(rect.x() * self.scale, rect.y() * self.scale, rect.width() * self.scale,
+                               rect.height() * self.scale)
+        paint.drawPixmap(rect, self.pixmap, source)
         # 设置绘图时画笔的颜色
         paint.setPen(QtCore.Qt.red)
         # 绘制矩形的方法，其中的参数来自鼠标事件
         paint.drawRect(self.firstPoint.x(), self.firstPoint.y(), self.endPoint.x() - self.firstPoint.x(),
                        self.endPoint.y() - self.firstPoint.y())
 
+    def get_selection_rect(self):
+        # 选框加上画笔的宽度
+        return QtCore.QRect(self.firstPoint, self.endPoint).normalized().adjusted(-1, -1, 2, 2)
+
+    def update_selection(self):
+        rect = self.get_selection_rect()
+        self.update(rect.united(self.last_rect))
+        self.last_rect = rect
+
     def mousePressEvent(self, a0: QtGui.QMouseEvent) -> None:
         self.firstPoint = a0.pos()
+        self.endPoint = a0.pos()
+        self.update_selection()
 
     def mouseMoveEvent(self, a0: QtGui.QMouseEvent) -> None:
         self.endPoint = a0.pos()
-        self.update()
+        self.update_selection()
 
     def mouseReleaseEvent(self, a0: QtGui.QMouseEvent) -> None:
         self.endPoint = a0.pos()
-        self.update()
+        self.update_selection()
         # 这里截图需要注意一点，前两个参数都进行了加一个像素单位的处理，目的是为了截图完成后排除画笔画出来的矩形边框
 
         cap_x1 = min(self.firstPoint.x(), self.endPoint.x()) * self.scale
@@ -79,10 +123,16 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         cap_y1 = min(self.firstPoint.y(), self.endPoint.y()) * self.scale
         cap_y2 = max(self.firstPoint.y(), self.endPoint.y()) * self.scale
 
-        if abs(cap_x1 - cap_x2) < 5 or abs(cap_y1 - cap_y2) < 5:
-            self.close()
-
-        self.cap = self.img.crop((cap_x1, cap_y1, cap_x2, cap_y2))
+        if self.fresh:
+            # 窗口关闭后再截图，否则会截到这个窗口
+            self.fresh_rect = (cap_x1, cap_y1, cap_x2, cap_y2, self.endPoint.x() * self.scale,
+                               self.endPoint.y() * self.scale)
+        elif abs(cap_x1 - cap_x2) < 5 or abs(cap_y1 - cap_y2) < 5:
+            # 单击没有拖动时，识别点击位置的单词或者对话框
+            self.cap = crop_click_word(self.img, self.endPoint.x() * self.scale, self.endPoint.y() * self.scale,
+                                       self.scale)
+        else:
+            self.cap = self.img.crop((cap_x1, cap_y1, cap_x2, cap_y2))
 
         self.close()
 
@@ -110,4 +160,94 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
     def closeEvent(self, event) -> None:
         if self.cap is not None:
             self.app.grab_search_word(self.cap)
+            self.cap = None
+        # 窗口只是隐藏，下一次截屏时重复使用，截图不再保留
+        self.img = None
+        self.pixmap = QPixmap()
         event.accept()
+
+    def hideEvent(self, event) -> None:
+        super(Ui_MainWindow, self).hideEvent(event)
+        if self.fresh_rect is not None:
+            # 隐藏窗口的请求处理完之后再重新截图
+            QtCore.QTimer.singleShot(0, self.grab_fresh)
+
+    def grab_fresh(self):
+        if self.fresh_rect is None or self.isVisible():
+            return
+        fresh_rect = self.fresh_rect
+        self.fresh_rect = None
+        # 把隐藏窗口的请求发给窗口系统，再等合成下一帧，截图中不会有这个窗口
+        QtGui.QGuiApplication.sync()
+        wait_for_compositor()
+        self.app.grab_fresh_word(self.sx, self.sy, self.sw, self.sh, self.scale, *fresh_rect)
+
+
+class OverlayPool(QtCore.QObject):
+    # 每个屏幕预先创建一个隐藏的截图窗口，屏幕增加、移除或者分辨率变化时更新
+    def __init__(self, app):
+        super(OverlayPool, self).__init__()
+        self.app = app
+        self.overlays = {}
+        # QScreen -> Ui_MainWindow
+        self.handlers = {}
+        # QScreen -> geometryChanged连接的槽，移除屏幕时断开
+
+        gui = QtGui.QGuiApplication.instance()
+        gui.screenAdded.connect(self.add_screen)
+        gui.screenRemoved.connect(self.remove_screen)
+        for screen in QtGui.QGuiApplication.screens():
+            self.add_screen(screen)
+
+    def add_screen(self, screen):
+        overlay = Ui_MainWindow(self.app)
+        overlay.set_screen(screen)
+        # 提前创建原生窗口
+        overlay.winId()
+        self.overlays[screen] = overlay
+        handler = partial(self.update_screen, screen)
+        screen.geometryChanged.connect(handler)
+        self.handlers[screen] = handler
+
+    def remove_screen(self, screen):
+        handler = self.handlers.pop(screen, None)
+        if handler is not None:
+            try:
+                screen.geometryChanged.disconnect(handler)
+            except (RuntimeError, TypeError):
+                # 屏幕对象可能已经销毁
+                pass
+        overlay = self.overlays.pop(screen, None)
+        if overlay is not None:
+            overlay.hide()
+            overlay.deleteLater()
+
+    def update_screen(self, screen, rect):
+        overlay = self.overlays.get(screen)
+        if overlay is not None and not overlay.isVisible():
+            overlay.set_screen(screen)
+
+    def get_overlay(self, sx, sy):
+        for screen, overlay in self.overlays.items():
+            geometry = screen.geometry()
+            if geometry.x() == sx and geometry.y() == sy:
+                return overlay
+        # 屏幕的位置变化还没有更新到窗口时，把这个屏幕的窗口移到截图的位置，没有窗口时才新建
+        print('no overlay for screen', sx, sy)
+        screen = QtGui.QGuiApplication.screenAt(QtCore.QPoint(sx, sy)) or QtGui.QGuiApplication.primaryScreen()
+        if screen not in self.overlays:
+            self.add_screen(screen)
+        overlay = self.overlays[screen]
+        overlay.set_screen(screen)
+        return overlay
+
+    def show_frame(self, img, sx, sy, sw, sh, sc, fresh=False):
+        overlay = self.get_overlay(sx, sy)
+        overlay.set_frame(img, sx, sy, sw, sh, sc, fresh)
+        overlay.show()
+        overlay.activateWindow()
+        return overlay
+
+    def close(self):
+        for screen in list(self.overlays):
+            self.remove_screen(screen)
@@ -0,0 +1,87 @@
+from bisect import bisect_right
+
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtGui import QGuiApplication
+
+# 屏幕布局：所有屏幕的位置、大小和缩放比例，只在屏幕增加、移除或者变化时重新计算
+# 屏幕的边界把桌面分成网格，每一格属于哪个屏幕预先算好，查找坐标所在的屏幕时用二分查找
+# 上下排列的屏幕也能正确区分
+
+
+class ScreenTopology(QObject):
+    changed = Signal()
+
+    def __init__(self, parent=None):
+        super(ScreenTopology, self).__init__(parent)
+        self.screens = []
+        # (sx, sy, sw, sh, sc)，逻辑坐标和缩放比例
+        self.xs = []
+        self.ys = []
+        self.grid = []
+        # grid[i][j]是xs[i]到xs[i + 1]、ys[j]到ys[j + 1]的格子所在的屏幕，没有屏幕时是-1
+
+        gui = QGuiApplication.instance()
+        gui.screenAdded.connect(self.add_screen)
+        gui.screenRemoved.connect(self.remove_screen)
+        gui.primaryScreenChanged.connect(self.screen_changed)
+        for screen in QGuiApplication.screens():
+            self.watch_screen(screen)
+        self.refresh()
+
+    def watch_screen(self, screen):
+        screen.geometryChanged.connect(self.screen_changed)
+        screen.logicalDotsPerInchChanged.connect(self.screen_changed)
+        screen.physicalDotsPerInchChanged.connect(self.screen_changed)
+
+    def screen_changed(self, *args):
+        self.refresh()
+
+    def add_screen(self, screen):
+        self.watch_screen(screen)
+        self.refresh()
+
+    def remove_screen(self, screen):
+        # 发出信号时屏幕可能还在列表中
+        self.refresh(screen)
+
+    def refresh(self, removed=None):
+        self.screens = []
+        for screen in QGuiApplication.screens():
+            if screen is removed:
+                continue
+            geometry = screen.geometry()
+            self.screens.append((geometry.x(), geometry.y(), geometry.width(), geometry.height(),
+                                 screen.devicePixelRatio()))
+
+        self.xs = sorted(set([sx for sx, sy, sw, sh, sc in self.screens] +
+                             [sx + sw for sx, sy, sw, sh, sc in self.screens]))
+        self.ys = sorted(set([sy for sx, sy, sw, sh, sc in self.screens] +
+                             [sy + sh for sx, sy, sw, sh, sc in self.screens]))
+        self.grid = [[-1] * max(0, len(self.ys) - 1) for i in range(max(0, len(self.xs) - 1))]
+        for index, (sx, sy, sw, sh, sc) in enumerate(self.screens):
+            for i in range(self.xs.index(sx), self.xs.index(sx + sw)):
+                for j in range(self.ys.index(sy), self.ys.index(sy + sh)):
+                    if self.grid[i][j] < 0:
+                        self.grid[i][j] = index
+        print('screens', self.screens)
+        self.changed.emit()
+
+    def index_at(self, x, y):
+        i = bisect_right(self.xs, x) - 1
+        j = bisect_right(self.ys, y) - 1
+        if 0 <= i < len(self.grid) and 0 <= j < len(self.grid[i]) and self.grid[i][j] >= 0:
+            return self.grid[i][j]
+        # 不在任何屏幕内时，比如屏幕之间的空隙，取最近的屏幕
+        nearest = 0
+        nearest_distance = None
+        for index, (sx, sy, sw, sh, sc) in enumerate(self.screens):
+            dx = max(sx - x, 0, x - (sx + sw - 1))
+            dy = max(sy - y, 0, y - (sy + sh - 1))
+            distance = dx * dx + dy * dy
+            if nearest_distance is None or distance < nearest_distance:
+                nearest = index
+                nearest_distance = distance
+        return nearest
+
+    def screen_at(self, x, y):
+        return self.screens[self.index_at(x, y)]
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# 截图文字的书写系统判断，用来给tesseract选择尽量少的语言模型
+# 从图片只能判断是拉丁字母还是中日文字，是假名还是汉字要看同一个窗口上一次识别出来的文字
+
+script_langs = {
+    'latin': 'eng',
+    'kana': 'jpn',
+    'han': 'chi_sim',
+    'cjk': 'jpn+chi_sim',
+}
+
+
+cjk_strokes = 2.0
+latin_strokes = 1.6
+# 每列平均笔画数的阈值，在两者之间的不判断
+
+
+def classify_text(text):
+    latin = 0
+    kana = 0
+    han = 0
+    for ch in text:
+        code = ord(ch)
+        if ch.isascii() and ch.isalpha():
+            latin += 1
+        elif 0x3040 <= code <= 0x30ff or 0x31f0 <= code <= 0x31ff or 0xff66 <= code <= 0xff9f:
+            kana += 1
+        elif 0x4e00 <= code <= 0x9fff or 0x3400 <= code <= 0x4dbf:
+            han += 1
+    total = latin + kana + han
+    if total == 0:
+        return None
+    if latin / total > 0.5:
+        return 'latin'
+    if kana > 0:
+        return 'kana'
+    return 'han'
+
+
+def get_runs(mask):
+    # 返回mask中连续True的区间[start, end)
+    padded = np.concatenate([[False], mask, [False]])
+    diff = np.diff(padded.astype(np.int8))
+    starts = np.flatnonzero(diff == 1)
+    ends = np.flatnonzero(diff == -1)
+    return starts, ends
+
+
+def classify_image(img):
+    # 只有把握比较大时才返回书写系统，不确定时返回None，tesseract使用设置的全部语言
+    # 中日文字每个字的外框接近正方形，宽度也比较一致，笔画多，竖着穿过一个字的笔画平均在2条以上
+    # 拉丁字母的宽度变化很大，而且经常连在一起，竖着穿过的笔画很少超过2条（e、a、s、g等是3条）
+    a = np.asarray(img.convert('L'), dtype=np.float32)
+    if a.size == 0:
+        return None
+    ink = a < a.mean()
+    if ink.mean() > 0.5:
+        # 深色背景浅色文字
+        ink = ~ink
+
+    vertical = a.shape[0] > a.shape[1] * 1.5
+    if vertical:
+        # 竖排文字只可能是中日文
+        return 'cjk'
+
+    row_starts, row_ends = get_runs(ink.any(axis=1))
+    if len(row_starts) == 0:
+        return None
+    line = np.argmax(row_ends - row_starts)
+    line_height = row_ends[line] - row_starts[line]
+    if line_height < 6:
+        return None
+
+    line_ink = ink[row_starts[line]:row_ends[line]]
+    col_starts, col_ends = get_runs(line_ink.any(axis=0))
+    widths = col_ends - col_starts
+    widths = widths[widths > line_height * 0.15]
+    if len(widths) < 2:
+        return None
+
+    # 每一列中笔画的条数
+    cols = line_ink[:, line_ink.any(axis=0)].astype(np.int8)
+    strokes = ((np.diff(cols, axis=0) == 1).sum(axis=0) + cols[0]).mean()
+
+    ratio = np.median(widths) / line_height
+    cv = widths.std() / widths.mean()
+    square = 0.6 <= ratio <= 1.3 and cv < 0.4
+    if square and strokes >= cjk_strokes:
+        return 'cjk'
+    if not square and strokes < latin_strokes:
+        return 'latin'
+    return None
+
+
+class ScriptDetector:
+    def __init__(self, max_windows=64):
+        self.max_windows = max_windows
+        self.window_scripts = OrderedDict()
+        # 窗口句柄 -> 上一次识别出的书写系统
+
+    def detect_script(self, img, hwnd):
+        # 图片判断不确定时返回None，使用设置的全部语言，不能沿用窗口上一次的结果
+        # 否则一次识别出拉丁字母以后，这个窗口中不确定的中日文截图都只用eng识别，错误的结果又会更新窗口的记录
+        # 窗口的记录只用来把中日文细分成假名或者汉字
+        img_script = classify_image(img)
+        cached = self.window_scripts.get(hwnd)
+        if img_script == 'cjk' and cached in ('kana', 'han'):
+            return cached
+        return img_script
+
+    def select_lang(self, script, default_lang):
+        if script is None:
+            return default_lang
+        # 只使用default_lang中有的语言模型
+        available = default_lang.split('+')
+        langs = [lang for lang in script_langs[script].split('+') if lang in available]
+        if not langs:
+            return default_lang
+        return '+'.join(langs)
+
+    def update(self, hwnd, text):
+        if hwnd is None:
+            return
+        script = classify_text(text)
+        if script is None:
+            # 没有识别出文字，可能是上次的判断错了
+            self.window_scripts.pop(hwnd, None)
+            return
+        self.window_scripts[hwnd] = script
+        self.window_scripts.move_to_end(hwnd)
+        while len(self.window_scripts) > self.max_windows:
+            self.window_scripts.popitem(last=False)
+
+
+def check_samples(corpus_path):
+    # 回归检查：拉丁字母的样本不能判断成中日文，中日文的样本不能判断成拉丁字母，返回出错的样本
+    from ocr_metrics import load_corpus
+
+    failures = []
+    for name, img, label in load_corpus(corpus_path):
+        expected = classify_text(label)
+        result = classify_image(img)
+        if (expected == 'latin' and result == 'cjk') or (expected in ('kana', 'han') and result == 'latin'):
+            failures.append(f'{name}: {label} -> {result}')
+    return failures
+
+
+if __name__ == '__main__':
+    # python script_detect.py [path/to/corpus]，默认使用data/ocr-samples
+    import os
+    import sys
+
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                      'data', 'ocr-samples')
+    failures = check_samples(corpus_path)
+    for failure in failures:
+        print('script detect error', failure)
+    sys.exit(1 if failures else 0)
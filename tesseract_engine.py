@@ -0,0 +1,168 @@
+import os
+import sys
+import glob
+import shutil
+import ctypes
+import ctypes.util
+from ctypes import c_void_p, c_char_p, c_int
+
+import pytesseract
+
+from tesseract_tsv import split_rows, reconstruct_text, join_words, word_confs
+
+# 两种调用tesseract的方式，接口相同，可以互相替换
+# api: 通过ctypes调用libtesseract的C API，语言模型只加载一次，一直驻留在进程中
+# subprocess: pytesseract，每次识别都启动一个tesseract进程，重新加载语言模型
+
+tsv_header = 'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext'
+
+
+def find_tesseract_library():
+    if sys.platform == 'win32':
+        # windows上libtesseract的dll和tesseract.exe在同一个目录
+        cmd = shutil.which(pytesseract.pytesseract.tesseract_cmd)
+        if cmd is None:
+            return None
+        tess_dir = os.path.dirname(os.path.abspath(cmd))
+        dlls = sorted(glob.glob(os.path.join(tess_dir, 'libtesseract*.dll')), reverse=True)
+        return dlls[0] if dlls else None
+    return ctypes.util.find_library('tesseract')
+
+
+def load_tesseract_library():
+    lib_path = find_tesseract_library()
+    if lib_path is None:
+        raise OSError('libtesseract not found')
+    if sys.platform == 'win32':
+        # leptonica等依赖的dll也在这个目录
+        os.add_dll_directory(os.path.dirname(lib_path))
+    lib = ctypes.CDLL(lib_path)
+
+    lib.TessBaseAPICreate.restype = c_void_p
+    lib.TessBaseAPICreate.argtypes = []
+    lib.TessBaseAPIInit2.restype = c_int
+    lib.TessBaseAPIInit2.argtypes = [c_void_p, c_char_p, c_char_p, c_int]
+    lib.TessBaseAPISetPageSegMode.restype = None
+    lib.TessBaseAPISetPageSegMode.argtypes = [c_void_p, c_int]
+    lib.TessBaseAPISetVariable.restype = c_int
+    lib.TessBaseAPISetVariable.argtypes = [c_void_p, c_char_p, c_char_p]
+    lib.TessBaseAPISetImage.restype = None
+    lib.TessBaseAPISetImage.argtypes = [c_void_p, c_char_p, c_int, c_int, c_int, c_int]
+    lib.TessBaseAPISetSourceResolution.restype = None
+    lib.TessBaseAPISetSourceResolution.argtypes = [c_void_p, c_int]
+    lib.TessBaseAPIRecognize.restype = c_int
+    lib.TessBaseAPIRecognize.argtypes = [c_void_p, c_void_p]
+    lib.TessBaseAPIGetTsvText.restype = c_void_p
+    lib.TessBaseAPIGetTsvText.argtypes = [c_void_p, c_int]
+    lib.TessDeleteText.restype = None
+    lib.TessDeleteText.argtypes = [c_void_p]
+    lib.TessBaseAPIClear.restype = None
+    lib.TessBaseAPIClear.argtypes = [c_void_p]
+    lib.TessBaseAPIEnd.restype = None
+    lib.TessBaseAPIEnd.argtypes = [c_void_p]
+    lib.TessBaseAPIDelete.restype = None
+    lib.TessBaseAPIDelete.argtypes = [c_void_p]
+    return lib
+
+
+class TesseractApi:
+    def __init__(self, tessdata_dir=None, oem=1):
+        self.lib = load_tesseract_library()
+        self.tessdata_dir = tessdata_dir
+        self.oem = oem
+        self.handles = {}
+        # 每种语言组合一个TessBaseAPI，初始化一次后一直复用
+
+    def get_handle(self, lang):
+        if lang in self.handles:
+            return self.handles[lang]
+        handle = self.lib.TessBaseAPICreate()
+        datapath = self.tessdata_dir.encode('utf-8') if self.tessdata_dir else None
+        if self.lib.TessBaseAPIInit2(handle, datapath, lang.encode('utf-8'), self.oem) != 0:
+            self.lib.TessBaseAPIDelete(handle)
+            raise RuntimeError(f'tesseract init error, lang: {lang}')
+        self.handles[lang] = handle
+        return handle
+
+    def image_to_data(self, img, lang, psm=6, variables=None):
+        handle = self.get_handle(lang)
+        if img.mode != 'L':
+            img = img.convert('RGB')
+        bpp = 1 if img.mode == 'L' else 3
+        data = img.tobytes()
+        width, height = img.size
+
+        self.lib.TessBaseAPISetPageSegMode(handle, psm)
+        if variables is not None:
+            for name, value in variables.items():
+                self.lib.TessBaseAPISetVariable(handle, name.encode('utf-8'), str(value).encode('utf-8'))
+        self.lib.TessBaseAPISetImage(handle, data, width, height, bpp, width * bpp)
+        # 截图没有dpi信息，和命令行一样按70dpi处理
+        self.lib.TessBaseAPISetSourceResolution(handle, 70)
+        try:
+            if self.lib.TessBaseAPIRecognize(handle, None) != 0:
+                raise RuntimeError('tesseract recognize error')
+            text_p = self.lib.TessBaseAPIGetTsvText(handle, 0)
+            try:
+                tsv = ctypes.string_at(text_p).decode('utf-8')
+            finally:
+                self.lib.TessDeleteText(text_p)
+        finally:
+            self.lib.TessBaseAPIClear(handle)
+        # C API输出的tsv没有表头，补上表头和pytesseract的输出保持一致
+        return f'{tsv_header}\n{tsv}'
+
+    def close(self):
+        for handle in self.handles.values():
+            self.lib.TessBaseAPIEnd(handle)
+            self.lib.TessBaseAPIDelete(handle)
+        self.handles.clear()
+
+
+class TesseractSubprocess:
+    def __init__(self, tessdata_dir=None, oem=1):
+        self.tessdata_dir = tessdata_dir
+        self.oem = oem
+
+    def image_to_data(self, img, lang, psm=6, variables=None):
+        tess_cmd = f'--psm {psm} --oem {self.oem}'
+        if variables is not None:
+            for name, value in variables.items():
+                # 命令行中空字符串要写成""
+                value = value if value != '' else '""'
+                tess_cmd = f'{tess_cmd} -c {name}={value}'
+        if self.tessdata_dir:
+            tess_cmd = f'{tess_cmd} --tessdata-dir {self.tessdata_dir}'
+        return pytesseract.image_to_data(img, lang=lang, config=tess_cmd)
+
+    def close(self):
+        pass
+
+
+def create_tesseract(backend, tessdata_dir=None):
+    if backend == 'api':
+        try:
+            return TesseractApi(tessdata_dir)
+        except (OSError, AttributeError) as e:
+            # 找不到libtesseract或者版本太旧时退回到pytesseract
+            print('tesseract api error, use subprocess', e)
+    return TesseractSubprocess(tessdata_dir)
+
+
+def recognize_text(tesseract, img, lang, psm=6, min_conf=0):
+    # 识别截图中的文字，返回(文字, 置信度)，置信度是单词置信度的平均值，0到1
+    tess_variables = {'lstm_choice_iterations': 0, 'page_separator': ''}
+    # tesseract会在末尾加form feed分页符，unicode码000c。
+    # -c page_separator=""设置分页符为空
+    data = tesseract.image_to_data(img, lang, psm=psm, variables=tess_variables)
+
+    rows = split_rows(data)
+    if psm == 6:
+        # 去重
+        text = reconstruct_text(rows, min_conf)
+    else:
+        text = join_words(rows, min_conf)
+    # tesseract的置信度是0到100
+    confs = word_confs(rows, max(min_conf, 0))
+    conf = sum(confs) / len(confs) / 100 if len(confs) > 0 and text != '' else 0.0
+    return text, conf
@@ -0,0 +1,36 @@
+# tesseract的tsv输出只切分一次成行，去重、拼接和置信度都在字符串列表上计算
+# 识别结果一般只有几行，循环比转换成numpy数组快（见tsv_benchmark.py）
+
+
+def split_rows(tsv):
+    # 第一行是表头，末尾有空行
+    return [line.split('\t') for line in tsv.split('\n')[1:] if line != '']
+
+
+def reconstruct_text(rows, min_conf=0):
+    # psm 6识别竖排文字时，第一行之外的每一行都是重复的，只取每行第一个字
+    # 第一行的单词完整保留，但是后面紧接着换行的单词只取第一个字
+    text = ''
+    for i, row in enumerate(rows):
+        if row[0] != '5' or len(row) != 12:
+            continue
+        if min_conf > 0 and float(row[10]) < min_conf:
+            # 单词的置信度是0到100
+            continue
+        if row[4] == '1':
+            if i + 2 < len(rows) and rows[i + 2][4] != row[4]:
+                text += row[11][:1]
+            else:
+                text += row[11]
+        elif i >= 2 and rows[i - 2][4] != row[4] and row[5] == '1':
+            text += row[11][:1]
+    return text
+
+
+def word_confs(rows, min_conf=0):
+    return [float(row[10]) for row in rows if row[0] == '5' and len(row) == 12 and float(row[10]) >= min_conf]
+
+
+def join_words(rows, min_conf=0):
+    # psm 5和7按行输出，没有psm 6识别竖排文字时的重复，按顺序拼接所有单词
+    return ''.join(row[11] for row in rows if row[0] == '5' and len(row) == 12 and float(row[10]) >= min_conf)
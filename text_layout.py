@@ -0,0 +1,156 @@
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from script_detect import get_runs
+
+# 根据截图的长宽比和投影判断文字排列方向，给tesseract选择psm
+# psm 5: 竖排文字，psm 6: 多行横排文字，psm 7: 单行横排文字
+
+layout_psm = {
+    'vertical': 5,
+    'block': 6,
+    'line': 7,
+}
+
+
+def get_bands(profile, min_gap=2):
+    # 投影中连续有文字的区间，间隔小于min_gap的合并（比如“三”“川”中间的空白）
+    starts, ends = get_runs(profile)
+    if len(starts) == 0:
+        return starts, ends
+    keep = np.concatenate([[True], starts[1:] - ends[:-1] >= min_gap])
+    merged_starts = starts[keep]
+    merged_ends = np.append(ends[np.flatnonzero(keep)[1:] - 1], ends[-1])
+    return merged_starts, merged_ends
+
+
+def is_cjk_columns(ink, col_starts, col_ends):
+    # 竖排的中日文字每一列宽度差不多，列间距差不多，每一列有几个字，每个字接近正方形
+    # 拉丁字母的一列通常只有一个字母（i和j是两段）
+    col_widths = col_ends - col_starts
+    if len(col_widths) < 2 or col_widths.min() < col_widths.max() * 0.7:
+        return False
+    col_gaps = col_starts[1:] - col_ends[:-1]
+    if len(col_gaps) > 1 and col_gaps.min() < col_gaps.max() * 0.5:
+        return False
+    counts = []
+    ratios = []
+    for start, end in zip(col_starts, col_ends):
+        cell_starts, cell_ends = get_bands(ink[:, start:end].any(axis=1))
+        counts.append(len(cell_starts))
+        ratios.extend((cell_ends - cell_starts) / (end - start))
+    return np.median(counts) >= 2 and 0.5 <= np.median(ratios) <= 1.5
+
+
+def detect_layout(img):
+    # 返回(排列方向, 是否确定)，不确定时使用同一个窗口上一次的结果
+    a = np.asarray(img.convert('L'), dtype=np.float32)
+    if a.size == 0:
+        return 'block', False
+    ink = a < a.mean()
+    if ink.mean() > 0.5:
+        ink = ~ink
+    h, w = ink.shape
+
+    row_starts, row_ends = get_bands(ink.any(axis=1))
+    # i、j上面的点单独成为一个很矮的文字带，不能当成一行
+    if len(row_starts) > 1:
+        keep = row_ends - row_starts >= (row_ends - row_starts).max() * 0.4
+        row_starts, row_ends = row_starts[keep], row_ends[keep]
+    col_starts, col_ends = get_bands(ink.any(axis=0))
+    if len(row_starts) == 0 or len(col_starts) == 0:
+        return 'block', False
+
+    row_heights = row_ends - row_starts
+    col_widths = col_ends - col_starts
+
+    if len(row_starts) == 1 and len(col_starts) == 1:
+        # 一个字或者一个连在一起的单词，很高的一块也可能是I、l这样的单个字母，不确定
+        if w > h * 1.5:
+            return 'line', True
+        return 'line', False
+
+    if len(row_starts) == 1:
+        # 只有一个横向的文字带，截图很高，或者文字带的高度远大于每一列的宽度并且每一列像中日文字一样排列整齐时，
+        # 是竖排的多列文字；拉丁字母的宽度各不相同（比如i、l和m），一行单词不能算作竖排
+        if h > w * 1.5:
+            return 'vertical', True
+        if row_heights[0] > np.median(col_widths) * 2 and is_cjk_columns(ink, col_starts, col_ends):
+            return 'vertical', True
+        return 'line', w > h * 1.5
+
+    if len(col_starts) == 1:
+        # 只有一个纵向的文字带，宽度远大于每一行的高度时是横排的多行文字
+        if col_widths[0] > np.median(row_heights) * 2:
+            return 'block', True
+        return 'vertical', True
+
+    # 中日文字排列整齐，行和列两个方向都有间隔，行距比字距大
+    row_gap = np.median(row_starts[1:] - row_ends[:-1])
+    col_gap = np.median(col_starts[1:] - col_ends[:-1])
+    if col_gap > row_gap * 1.2:
+        return 'vertical', True
+    if row_gap > col_gap * 1.2:
+        return 'block', True
+    return 'block', False
+
+
+def manga_ocr_rotated(layout, script):
+    # manga-ocr本身能识别竖排的中日文字，只有竖着排的拉丁字母（比如书脊）转成横排
+    return layout == 'vertical' and script == 'latin'
+
+
+def rotate_for_manga_ocr(img, layout, script):
+    if manga_ocr_rotated(layout, script):
+        return img.transpose(Image.ROTATE_270)
+    return img
+
+
+class LayoutDetector:
+    def __init__(self, max_windows=64):
+        self.max_windows = max_windows
+        self.window_layouts = OrderedDict()
+        # 窗口句柄 -> 上一次确定的排列方向
+
+    def detect(self, img, hwnd):
+        layout, confident = detect_layout(img)
+        if hwnd is None:
+            return layout
+        if confident:
+            self.window_layouts[hwnd] = layout
+            self.window_layouts.move_to_end(hwnd)
+            while len(self.window_layouts) > self.max_windows:
+                self.window_layouts.popitem(last=False)
+            return layout
+        return self.window_layouts.get(hwnd, layout)
+
+
+def check_samples(corpus_path):
+    # 回归检查：拉丁字母的样本是横排的，预处理以后不能判断成竖排，返回出错的样本
+    from ocr_metrics import load_corpus
+    from ocr_preprocess import preprocess
+    from script_detect import classify_text
+
+    failures = []
+    for name, img, label in load_corpus(corpus_path):
+        if classify_text(label) != 'latin':
+            continue
+        layout, confident = detect_layout(preprocess(img))
+        if layout == 'vertical':
+            failures.append(f'{name}: {label} -> {layout}')
+    return failures
+
+
+if __name__ == '__main__':
+    # python text_layout.py [path/to/corpus]，默认使用data/ocr-samples
+    import os
+    import sys
+
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                      'data', 'ocr-samples')
+    failures = check_samples(corpus_path)
+    for failure in failures:
+        print('layout detect error', failure)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,68 @@
+import os
+
+import psutil
+
+# OCR的线程预算：torch默认每个进程占满所有核，和QtWebEngine渲染查词结果抢CPU，两边都变慢
+# 按物理核数减去给渲染保留的核，平分给OCR子进程；tesseract一般设为1个线程
+# 此模块在OCR子进程中也会用到，不要导入Qt相关的模块
+
+omp_variables = ['OMP_NUM_THREADS', 'OMP_THREAD_LIMIT', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+
+def get_core_count():
+    # 超线程对矩阵运算帮助不大，按物理核计算
+    return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+
+
+def get_ocr_threads(threads='auto', reserve=1, workers=1):
+    # 每个OCR子进程的intra-op线程数
+    if threads != 'auto':
+        try:
+            return max(1, int(threads))
+        except ValueError:
+            print('ocr threads config error', threads)
+    return max(1, (get_core_count() - max(0, reserve)) // max(1, workers))
+
+
+def set_omp_threads(threads):
+    # OpenMP在库加载时读取环境变量，要在导入torch、onnxruntime和加载tesseract之前设置
+    for name in omp_variables:
+        os.environ[name] = str(threads)
+
+
+def set_torch_threads(intra, inter=1):
+    import torch
+    torch.set_num_threads(intra)
+    try:
+        torch.set_num_interop_threads(inter)
+    except RuntimeError:
+        # inter-op线程池启动后不能再修改
+        pass
+
+
+class CpuMeter:
+    # 统计本进程和OCR子进程的CPU时间，用来显示每次截屏查词用了多少CPU
+    # 只统计传入的OCR子进程，QtWebEngine的渲染进程也是子进程，不能算在OCR里
+    def __init__(self):
+        self.process = psutil.Process(os.getpid())
+        self.workers = {}
+        # pid -> psutil.Process，保留同一个对象，pid被新进程重用时会抛出NoSuchProcess
+
+    def snapshot(self, worker_pids=()):
+        workers = {}
+        for pid in worker_pids:
+            try:
+                workers[pid] = self.workers[pid] if pid in self.workers else psutil.Process(pid)
+            except psutil.NoSuchProcess:
+                continue
+        self.workers = workers
+
+        total = 0.0
+        for process in [self.process] + list(workers.values()):
+            try:
+                times = process.cpu_times()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                # 子进程可能刚好退出
+                continue
+            total += times.user + times.system
+        return total
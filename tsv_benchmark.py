@@ -0,0 +1,75 @@
+import time
+import random
+from argparse import ArgumentParser
+
+from tesseract_tsv import split_rows, reconstruct_text
+from tesseract_engine import tsv_header
+
+# tesseract tsv解析的性能测试，比较原来的去重循环和现在先切分成行再去重
+# python tsv_benchmark.py --lines 20 --words 10 --repeat 1000
+
+
+def make_tsv(lines, words):
+    chars = 'あいうえおかきくけこ日本語漢字テストabc'
+    rows = [tsv_header, '1\t1\t0\t0\t0\t0\t0\t0\t100\t100\t-1\t', '2\t1\t1\t0\t0\t0\t0\t0\t100\t100\t-1\t',
+            '3\t1\t1\t1\t0\t0\t0\t0\t100\t100\t-1\t']
+    for line in range(1, lines + 1):
+        rows.append(f'4\t1\t1\t1\t{line}\t0\t0\t{line * 20}\t100\t20\t-1\t')
+        for word in range(1, words + 1):
+            text = ''.join(random.choice(chars) for i in range(random.randint(1, 4)))
+            conf = random.uniform(0, 100)
+            rows.append(f'5\t1\t1\t1\t{line}\t{word}\t{word * 20}\t{line * 20}\t20\t20\t{conf:.6f}\t{text}')
+    return '\n'.join(rows) + '\n'
+
+
+def reconstruct_text_strings(data):
+    # 原来的实现
+    data_list = [line.split('\t') for line in data.split('\n')]
+    text = ''
+    for di in range(1, len(data_list)):
+        data = data_list[di]
+        if data[0] == '5' and len(data) == 12:
+            if data[4] == '1':
+                if di + 2 < len(data_list):
+                    edata = data_list[di + 2]
+                    if len(edata) == 12 and data[4] != edata[4]:
+                        text += data[-1][0]
+                    else:
+                        text += data[-1]
+                else:
+                    text += data[-1]
+            else:
+                if data[4] != data_list[di - 2][4]:
+                    if data[5] == '1':
+                        text += data[-1][0]
+    return text
+
+
+def reconstruct_text_rows(data):
+    return reconstruct_text(split_rows(data), min_conf=-1)
+
+
+def bench(func, data, repeat):
+    t1 = time.perf_counter()
+    for i in range(repeat):
+        func(data)
+    return (time.perf_counter() - t1) / repeat * 1000000
+
+
+def main():
+    parser = ArgumentParser(description='tesseract tsv parser micro-benchmark')
+    parser.add_argument('--lines', type=int, default=10)
+    parser.add_argument('--words', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    data = make_tsv(args.lines, args.words)
+    if reconstruct_text_strings(data) != reconstruct_text_rows(data):
+        print('warning: outputs differ')
+    for name, func in [('strings', reconstruct_text_strings), ('rows', reconstruct_text_rows)]:
+        print(f'{name:<10}{bench(func, data, args.repeat):>10.1f} us')
+
+
+if __name__ == '__main__':
+    main()